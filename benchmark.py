@@ -0,0 +1,160 @@
+'''Scaling benchmark of the steering demos
+
+Runs the headless runner of each demo (flocking, hiding, marksmanship and
+soldier_on_patrol) at a range of agent counts, each in its own process so that
+peak memory is measured per run. Each case is run a few times after a warmup
+run, and the run with the median ticks per second is kept, since single runs
+of the fast cases vary several times over. Records ticks per second, per-tick
+latency percentiles and peak RSS in a JSON report, and can compare the
+results with a stored baseline report to catch regressions in the update hot
+paths:
+
+    python benchmark.py --out baseline.json
+    python benchmark.py --baseline baseline.json
+
+The default counts finish in a minute or so. Large counts are opt-in, e.g.
+--counts 10000 100000 (each can take minutes per run on the object paths).
+When comparing, the exit status is 1 if any median is slower than the
+baseline by more than the tolerance.
+
+'''
+
+import json
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# demo directory -> headless scenario
+DEMOS = {
+    'flocking': 'flock',
+    'hiding': 'hide',
+    'marksmanship': 'range',
+    'soldier_on_patrol': 'patrol',
+}
+
+
+def run_case(demo, agents, args):
+    ''' Run one benchmark case args.warmup times (ignored), then args.repeats
+        times, and return the result dict of the run with the median ticks
+        per second, with the rates of all the runs added. Stops at the first
+        failed run and returns its result. '''
+    for _ in range(args.warmup):
+        result = run_demo(demo, agents, args)
+        if 'error' in result:
+            return result
+    runs = []
+    for _ in range(max(args.repeats, 1)):
+        result = run_demo(demo, agents, args)
+        if 'error' in result:
+            return result
+        runs.append(result)
+    runs.sort(key=lambda run: run['ticks_per_sec'] or 0.0)
+    result = runs[len(runs) // 2]
+    result['repeats_ticks_per_sec'] = [run['ticks_per_sec'] for run in runs]
+    return result
+
+
+def run_demo(demo, agents, args):
+    ''' Run one headless benchmark in a separate process and return its
+        result dict (with an 'error' entry if it failed or timed out). '''
+    cmd = [sys.executable, 'headless.py', '--json',
+           '--scenario', DEMOS[demo], '--agents', str(agents),
+           '--ticks', str(args.ticks), '--size', str(args.size),
+           '--seed', str(args.seed)]
+    if args.arrays and demo == 'flocking':
+        cmd.append('--arrays')
+    result = {'demo': demo, 'agents': agents, 'ticks': args.ticks}
+    try:
+        done = subprocess.run(cmd, cwd=os.path.join(HERE, demo),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        result['error'] = 'timeout after %ss' % args.timeout
+        return result
+    if done.returncode != 0:
+        lines = done.stderr.strip().splitlines()
+        result['error'] = lines[-1] if lines else 'exit %d' % done.returncode
+        return result
+    result.update(json.loads(done.stdout.strip().splitlines()[-1]))
+    result['agents'] = agents  # as requested (some scenarios remove agents)
+    return result
+
+
+def compare(runs, baseline, tolerance):
+    ''' Print (median) ticks/sec against the baseline. Returns the number of
+        runs slower than the baseline by more than tolerance (a fraction). '''
+    base = dict(((r['demo'], r['agents']), r) for r in baseline['runs'])
+    regressions = 0
+    print('%-18s %7s %12s %12s %8s' % ('demo', 'agents', 'ticks/sec',
+                                       'baseline', 'change'))
+    for run in runs:
+        old = base.get((run['demo'], run['agents']))
+        if old is None or not old.get('ticks_per_sec') or \
+                not run.get('ticks_per_sec'):
+            continue
+        change = run['ticks_per_sec'] / old['ticks_per_sec'] - 1.0
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('%-18s %7d %12.1f %12.1f %+7.1f%%%s' % (
+            run['demo'], run['agents'], run['ticks_per_sec'],
+            old['ticks_per_sec'], 100.0 * change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark the demos headlessly.')
+    parser.add_argument('--demos', nargs='+', choices=sorted(DEMOS),
+                        default=sorted(DEMOS))
+    parser.add_argument('--counts', type=int, nargs='+',
+                        default=[10, 100, 300],
+                        help='agent counts to run (large counts such as '
+                             '10000 and 100000 take minutes per run)')
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--size', type=int, default=500,
+                        help='world width and height')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--arrays', action='store_true',
+                        help='use the NumPy array store for flocking')
+    parser.add_argument('--repeats', type=int, default=5,
+                        help='timed runs of each case (the median is kept)')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='untimed runs of each case first')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds allowed for each run')
+    parser.add_argument('--out', help='save the report to this JSON file')
+    parser.add_argument('--baseline', help='report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown of the median against the '
+                             'baseline')
+    args = parser.parse_args(argv)
+
+    runs = []
+    for demo in args.demos:
+        for agents in args.counts:
+            result = run_case(demo, agents, args)
+            runs.append(result)
+            if 'error' in result:
+                print('%-18s %7d  %s' % (demo, agents, result['error']))
+            else:
+                print('%-18s %7d %10.1f ticks/sec  p99 %8.2f ms  %7.1f MB' % (
+                    demo, agents, result['ticks_per_sec'] or 0,
+                    result['p99_ms'] or 0, result['peak_rss_mb'] or 0))
+    report = {'ticks': args.ticks, 'size': args.size, 'seed': args.seed,
+              'arrays': args.arrays, 'repeats': args.repeats, 'runs': runs}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(runs, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,17 @@ from vector2d import Point2D
 from graphics import egi, KEY
 from math import sin, cos, radians, sqrt
 from random import random, randrange, uniform
+from itertools import count
 from path import Path
+from profiler import profiler
+from time import perf_counter
+from operator import attrgetter
+
+by_id = attrgetter('id')
 
 AGENT_MODES = {
+    KEY._1: 'flocking',
+    KEY._2: 'topological',
 }
 
 class Agent(object):
@@ -22,11 +30,18 @@ class Agent(object):
         'normal': 1.0,
         'fast': 0.01
     }
+    # separate only pushes away from neighbours closer than this
+    SEPARATE_DIST = 80.0
+    # creation order numbers (see Agent.id)
+    _ids = count()
 
     def __init__(self, world=None, scale=30.0, mass=1.0, mode=None, color=None):
         # keep a reference to the world object
         self.world = world
+        self._mode = None
         self.mode = mode
+        # unique, fixed, creation order number
+        self.id = next(Agent._ids)
         # where am i and where am i going? random start pos
         dir = radians(random()*360)
         self.pos = Vector2D(randrange(world.cx), randrange(world.cy))
@@ -49,6 +64,11 @@ class Agent(object):
             Point2D( 1.0,  0.0),
             Point2D(-1.0, -0.6)
         ]
+        # world space vehicle_shape, recalculated when shape_dirty is set
+        # or the world array store has integrated since (shape_generation)
+        self.shape_pts = None
+        self.shape_dirty = True
+        self.shape_generation = None
 
         # wander details
         self.wander_target = Vector2D(1, 0)
@@ -65,66 +85,117 @@ class Agent(object):
 
         self.neighbours = []
         self.neighbour_radius = 150
+        # separation force, summed by World.separate_pairs
+        self.separation = Vector2D()
+        # 'topological' mode: only the k nearest within the radius
+        self.neighbour_count = 7
 
         # debug draw info?
         self.show_info = False
 
-        # data for drawing walls
-        self.walls = [
-            Vector2D(10.0,490.0), 
-            Vector2D(490.0,490.0), 
-            Vector2D(490.0,10.0), 
-            Vector2D(10.0,10.0)
-        ]
+        # the walls to avoid (drawn by the world)
+        self.walls = world.walls
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        # let the world know, for its mode summary
+        if mode != self._mode:
+            self._mode = mode
+            if self.world is not None:
+                self.world.modes_changed = True
 
     def calculate(self, delta):
         # calculate the current steering force
         mode = self.mode
-        if mode == 'flocking':
+        if mode == 'flocking' and self.world.far_field is not None:
             force = self.wander_wt * self.wander(delta)
-            self.find_neighbours()
+            force += self.far_field_flocking()
+        elif mode == 'flocking' or mode == 'topological':
+            force = self.wander_wt * self.wander(delta)
+            # (already found this tick by World.separate_pairs?)
+            if mode != 'flocking' or not self.world.pairs_separated:
+                self.find_neighbours()
             force += self.align_wt * self.align(self.neighbours)
-            force += self.separate_wt * self.separate(self.neighbours)
+            force += self.separate_wt * self.separation_force()
             force += self.cohesion_wt * self.cohesion(self.neighbours)
         else:
             force = Vector2D()
-        self.force = force
-        return force
+        # update in place, self.force may be a view into the world arrays
+        self.force.x = force.x
+        self.force.y = force.y
+        return self.force
 
     def update(self, delta):
         ''' update vehicle position and orientation '''
         # calculate and set self.force to be applied
         ## force = self.calculate()
-        force = self.calculate(delta)   #delta needed for wander
+        if profiler.enabled:
+            start = perf_counter()
+            self.calculate(delta)
+            middle = perf_counter()
+            self.integrate(delta)
+            profiler.add('calculate', middle - start)
+            profiler.add('integrate', perf_counter() - middle)
+        else:
+            self.calculate(delta)   #delta needed for wander
+            self.integrate(delta)
+
+    def integrate(self, delta):
+        ''' apply the current force (self.force) to the vehicle velocity,
+            position and orientation '''
+        force = self.force
         # limit force for wander
         force.truncate(self.max_force)
         # determin the new accelteration
-        self.accel = force / self.mass  # not needed if mass = 1.0
-        # new velocity
-        self.vel += self.accel * delta
-        # check for limits of new velocity
-        self.vel.truncate(self.max_speed)
+        accel = self.accel.set_from(force)
+        accel /= self.mass  # not needed if mass = 1.0
+        # new velocity, within its limits
+        vel = self.vel
+        vel.add_scaled(accel, delta)
+        speed = vel.truncate_length(self.max_speed)
         # update position
-        self.pos += self.vel * delta
+        self.pos.add_scaled(vel, delta)
         # update heading is non-zero velocity (moving)
-        if self.vel.length_sq() > 0.00000001:
-            self.heading = self.vel.get_normalised()
-            self.side = self.heading.perp()
+        if speed > 0.0001:
+            vel.normalise_into(self.heading)
+            self.heading.perp_into(self.side)
         # treat world as continuous space - wrap new position if needed
         self.world.wrap_around(self.pos)
+        if speed > 0.:
+            # moved, so the world space shape needs recalculating
+            self.shape_dirty = True
+
+    def shape_points(self):
+        ''' Return vehicle_shape in world space. The points are cached and
+            only recalculated after the pose has changed (shape_dirty, or a
+            new array store generation). '''
+        arrays = self.world.arrays
+        if arrays is not None and arrays.generation != self.shape_generation:
+            self.shape_generation = arrays.generation
+            self.shape_dirty = True
+        if self.shape_dirty:
+            self.shape_pts = self.world.transform_points(
+                self.vehicle_shape, self.pos, self.heading, self.side,
+                self.scale)
+            self.shape_dirty = False
+        return self.shape_pts
 
     def render(self, color=None):
         ''' Draw the triangle agent with color'''
         # draw the ship
         egi.set_pen_color(name=self.color)
-        pts = self.world.transform_points(self.vehicle_shape, self.pos,
-                                          self.heading, self.side, self.scale)
+        pts = self.shape_points()
         # draw it!
         egi.closed_shape(pts)
+        self.render_details()
 
-        # draw the border
-        egi.blue_pen()
-        egi.closed_shape(self.walls, False)
+    def render_details(self):
+        ''' Draw the velocity feeler, and the debug info lines if on (all
+            but the vehicle shape). '''
         egi.red_pen()
         egi.line_with_arrow(self.pos, self.pos + self.vel * 0.5, 5)    #feeler1
 
@@ -149,8 +220,10 @@ class Agent(object):
 
     def seek(self, target_pos):
         ''' move towards target position '''
-        desired_vel = (target_pos - self.pos).normalise() * self.max_speed
-        return (desired_vel - self.vel)
+        force = Vector2D().set_diff(target_pos, self.pos).normalise()
+        force *= self.max_speed  # desired velocity
+        force -= self.vel
+        return force
 
     def wander(self, delta):
         ''' random wandering using a projected jitter circle '''
@@ -204,8 +277,9 @@ class Agent(object):
         return center_of_mass
 
     def separate(self, group):
-        min = 80.0
+        min = self.SEPARATE_DIST
         steerForce = Vector2D()
+        push = Vector2D()
 
         for agent in group:
             if agent.pos != self.pos and agent.pos.distance(self.pos) < min:
@@ -219,12 +293,71 @@ class Agent(object):
 
                 #difference force
                 steerForce += diff.normalise() / diff.length()
-                self.vel -= steerForce 
+                push += steerForce
 
+        # velocity is pushed by the running total after each neighbour
+        self.vel -= push
         return self.vel
 
+    def separation_force(self):
+        ''' separate(), or the force from World.separate_pairs() if done '''
+        if self.mode == 'flocking' and self.world.pairs_separated:
+            return self.separation
+        return self.separate(self.neighbours)
+
+    def far_field_flocking(self):
+        ''' The weighted align, separate and cohesion forces, with the
+            neighbour heading and position averages taken from the world
+            quadtree node aggregates (see World.use_far_field). Only the
+            neighbours close enough to separate from are found one by one. '''
+        world = self.world
+        count, sx, sy, hx, hy = world.grid.aggregate(
+            self.pos, self.neighbour_radius, world.far_field, self)
+        align = Vector2D()
+        center_of_mass = Vector2D()
+        if count > 0:
+            align = Vector2D(hx / count, hy / count) - self.heading
+            center_of_mass = Vector2D(sx / count, sy / count)
+        if not world.pairs_separated:
+            self.find_flock_neighbours()
+        force = self.align_wt * align
+        force += self.separate_wt * self.separation_force()
+        force += self.cohesion_wt * center_of_mass
+        return force
+
+    def find_flock_neighbours(self):
+        ''' Find the neighbours that flocking visits one by one: all of them,
+            or in far field mode only those close enough to separate from. '''
+        world = self.world
+        if world.far_field is not None:
+            radius = min(self.neighbour_radius, self.SEPARATE_DIST)
+            found = world.grid.query(self.pos, radius)
+            # in creation order, not tree order (see search_neighbours)
+            found.sort(key=by_id)
+            self.neighbours[:] = found
+        else:
+            self.find_neighbours()
+
     def find_neighbours(self):
-        self.neighbours[:] = [n for n in self.world.agents if self.pos.distance(n.pos) < self.neighbour_radius]
+        if profiler.enabled:
+            start = perf_counter()
+            self.neighbours[:] = self.search_neighbours()
+            profiler.add('neighbours', perf_counter() - start)
+        else:
+            self.neighbours[:] = self.search_neighbours()
+
+    def search_neighbours(self):
+        if self.mode == 'topological':
+            return self.world.grid.nearest(self.pos, self.neighbour_count,
+                                           self.neighbour_radius, self)
+        lists = self.world.neighbour_lists
+        if lists is not None:
+            return lists.query(self)
+        found = self.world.grid.query(self.pos, self.neighbour_radius)
+        # in creation order, as the brute force search over the agents list
+        # gave them (separate() depends on the neighbour order)
+        found.sort(key=by_id)
+        return found
 
     def avoid_walls(self):
         feeler1 = self.pos + self.vel * 0.5
@@ -0,0 +1,198 @@
+'''Structure-of-arrays store for agent motion state
+
+Keeps the pos, vel, heading, side, scale, force, accel and wander target of
+every agent in a world as contiguous float64 NumPy columns (one row per agent), so
+that integration can be done for the whole world with a handful of array
+operations instead of a dozen small Vector2D objects per agent. The scalar
+parameters that the batch behaviours need (limits, wander and flocking
+weights) are copied into (N,) columns as well.
+
+Attached agents keep working as before: their vector attributes are replaced
+with RowVector views onto their row, so agent code reads and writes the
+arrays directly. Note that this only holds for in-place changes (x/y access,
++=, normalise() etc.) - assigning a new Vector2D to a viewed attribute breaks
+the link to the store.
+
+'''
+
+import numpy as np
+from vector2d import Vector2D
+
+COLUMNS = ('pos', 'vel', 'heading', 'side', 'scale', 'force', 'accel',
+           'wander_target')
+PARAMS = ('mass', 'max_speed', 'max_force',
+          'wander_dist', 'wander_radius', 'wander_jitter',
+          'wander_wt', 'align_wt', 'cohesion_wt', 'separate_wt',
+          'neighbour_radius')
+
+
+class RowVector(Vector2D):
+    ''' A Vector2D whose x and y values are stored in one row of an (N,2)
+        array column of an AgentArrays store. '''
+    __slots__ = ('_data', '_row')
+
+    def __init__(self, data, row):
+        self._data = data
+        self._row = row
+
+    @property
+    def x(self):
+        return self._data.item(self._row, 0)
+
+    @x.setter
+    def x(self, value):
+        self._data[self._row, 0] = value
+
+    @property
+    def y(self):
+        return self._data.item(self._row, 1)
+
+    @y.setter
+    def y(self, value):
+        self._data[self._row, 1] = value
+
+
+def truncate_rows(vecs, limits):
+    ''' Limit the length of each row vector in vecs (in place) to the matching
+        value in limits. Same as Vector2D.truncate(), for all rows at once. '''
+    length = np.sqrt(np.einsum('ij,ij->i', vecs, vecs))
+    over = length > limits
+    vecs[over] *= (limits[over] / length[over])[:, None]
+
+
+def transform_shapes(shape, pos, heading, side=None, scale=1.0):
+    ''' Transform one shape of K points (a list of points or a (K,2) array)
+        to world space for N agents at once, like World.transform_points()
+        for each agent. pos and heading are (N,2) arrays, side defaults to
+        the perp() of heading, and scale can be a scalar, an (N,) array or an
+        (N,2) array of x and y scales. Returns an (N,K,2) array of vertices,
+        one row of K points per agent. '''
+    if not isinstance(shape, np.ndarray):
+        shape = np.array([(pt.x, pt.y) for pt in shape], dtype=float)
+    if side is None:
+        side = np.column_stack((-heading[:, 1], heading[:, 0]))
+    scale = np.asarray(scale, dtype=float)
+    if scale.ndim < 2:
+        scale = np.broadcast_to(scale[..., None], (len(pos), 2))
+    # scale the shape points for each agent, (N,K) local x and y values
+    local_x = scale[:, 0, None] * shape[None, :, 0]
+    local_y = scale[:, 1, None] * shape[None, :, 1]
+    # then rotate (forward * x + side * y) and translate
+    return (pos[:, None, :] + heading[:, None, :] * local_x[:, :, None] +
+            side[:, None, :] * local_y[:, :, None])
+
+
+class AgentArrays(object):
+    ''' Contiguous column storage for the motion state of a list of agents.
+        Rows are in the same order as the agents list they were synced to. '''
+
+    def __init__(self, capacity=64):
+        self.agents = []
+        self.count = 0
+        self.capacity = 0
+        # number of integrate() calls, for the agent shape caches (see
+        # Agent.shape_points)
+        self.generation = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        ''' (Re)allocate all columns with room for capacity rows, keeping
+            existing rows and re-pointing existing views at the new arrays. '''
+        n = self.count
+        for name in COLUMNS:
+            data = np.zeros((capacity, 2))
+            if n:
+                data[:n] = getattr(self, name)[:n]
+            setattr(self, name, data)
+        for name in PARAMS:
+            data = np.ones(capacity)
+            if n:
+                data[:n] = getattr(self, name)[:n]
+            setattr(self, name, data)
+        self.capacity = capacity
+        for agent in self.agents:
+            for name in COLUMNS:
+                getattr(agent, name)._data = getattr(self, name)
+
+    def attach(self, agent):
+        ''' Copy the agent state into a new row and replace the agent vectors
+            with views onto that row. '''
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        row = self.count
+        for name in COLUMNS:
+            data = getattr(self, name)
+            vec = getattr(agent, name)
+            data[row] = vec.x, vec.y
+            setattr(agent, name, RowVector(data, row))
+        self.refresh_params(agent, row)
+        self.agents.append(agent)
+        self.count += 1
+
+    def refresh_params(self, agent, row):
+        ''' Copy the scalar PARAMS of the agent into its row. Call this after
+            changing one of them (max_speed, a weight...) on an attached
+            agent. '''
+        for name in PARAMS:
+            getattr(self, name)[row] = getattr(agent, name)
+
+    def clear(self):
+        ''' Detach all agents, giving them back plain Vector2D values. '''
+        for agent in self.agents:
+            for name in COLUMNS:
+                vec = getattr(agent, name)
+                setattr(agent, name, Vector2D(vec.x, vec.y))
+        self.agents = []
+        self.count = 0
+
+    def sync(self, agents):
+        ''' Make the rows match the agents list. New agents appended to the
+            list are attached; any other change rebuilds the whole store. '''
+        n = self.count
+        if self.agents != agents[:n]:
+            self.clear()
+            n = 0
+        for agent in agents[n:]:
+            self.attach(agent)
+
+    def shape_vertices(self, shape):
+        ''' Return the (N,K,2) world space vertices of shape (K points) for
+            every agent, using their pos, heading, side and scale rows. '''
+        n = self.count
+        return transform_shapes(shape, self.pos[:n], self.heading[:n],
+                                self.side[:n], self.scale[:n])
+
+    def integrate(self, delta, cx, cy):
+        ''' Apply the current force of every agent: truncate the force, Euler
+            integrate velocity and position, limit the speed, update heading
+            and side of moving agents and wrap positions around the world.
+            Matches Agent.update() after the force has been calculated. '''
+        n = self.count
+        self.generation += 1
+        pos = self.pos[:n]
+        vel = self.vel[:n]
+        heading = self.heading[:n]
+        side = self.side[:n]
+        force = self.force[:n]
+        accel = self.accel[:n]
+
+        truncate_rows(force, self.max_force[:n])
+        np.divide(force, self.mass[:n, None], out=accel)
+        vel += accel * delta
+        truncate_rows(vel, self.max_speed[:n])
+        pos += vel * delta
+
+        # update heading if non-zero velocity (moving)
+        speed_sq = np.einsum('ij,ij->i', vel, vel)
+        moving = speed_sq > 0.00000001
+        heading[moving] = vel[moving] / np.sqrt(speed_sq[moving])[:, None]
+        side[:, 0] = -heading[:, 1]
+        side[:, 1] = heading[:, 0]
+
+        # toroidal wrap, the same way as World.wrap_around()
+        for axis, size in ((0, cx), (1, cy)):
+            p = pos[:, axis]
+            over = p > size
+            under = p < 0
+            p[over] -= size
+            p[under] = size - p[under]
@@ -0,0 +1,145 @@
+'''Vectorised flocking: align, cohesion and separate for all agents at once
+
+Neighbour relations are given as two index arrays (pair_i, pair_j), meaning
+agent pair_j[k] is a neighbour of agent pair_i[k]. Pairs can come from
+neighbour_pairs() below or any other neighbour search. Each flocking term is
+then a segmented sum over the pairs of each agent (np.bincount), instead of
+a Python loop over each agent's neighbour list.
+
+'''
+
+import numpy as np
+import steering
+
+
+def _col(value):
+    ''' Shape a scalar or (N,) parameter to broadcast over (N,2) rows. '''
+    value = np.asarray(value, dtype=float)
+    return value[:, None] if value.ndim == 1 else value
+
+
+def _seg_sum(values, idx, n):
+    ''' Sum the (M,2) row values into n rows by the (M,) index array. '''
+    # (bincount gives ints, not floats, when there are no values)
+    return np.column_stack((np.bincount(idx, values[:, 0], n),
+                            np.bincount(idx, values[:, 1], n))).astype(float)
+
+
+def neighbour_pairs(pos, radius, cx, cy):
+    ''' Return (pair_i, pair_j), the indices of every ordered pair of
+        different agents closer than radius. radius can be a scalar or an
+        (N,) array (the radius of agent i is used for its pairs). Pairs are
+        sorted by i then j - the same neighbour order as a brute force scan
+        of the agents list. Uses a cell grid (wrapping at the world edges) so
+        only agents in adjacent cells are compared. '''
+    n = len(pos)
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), (n,))
+    if n == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty
+    cell_size = max(radius.max(), 1.0)
+    cols = max(1, int(max(cx, 1) // cell_size))
+    rows = max(1, int(max(cy, 1) // cell_size))
+    col = np.floor(pos[:, 0] / (max(cx, 1) / cols)).astype(np.intp) % cols
+    row = np.floor(pos[:, 1] / (max(cy, 1) / rows)).astype(np.intp) % rows
+
+    # sort agents by cell, and find where each cell's run starts and ends
+    cell = col * rows + row
+    order = np.argsort(cell, kind='stable')
+    all_cells = np.arange(cols * rows)
+    starts = np.searchsorted(cell[order], all_cells)
+    ends = np.searchsorted(cell[order], all_cells, side='right')
+
+    # visit each distinct neighbouring cell once (small grids wrap onto
+    # themselves)
+    dcols = range(cols) if cols < 3 else (-1, 0, 1)
+    drows = range(rows) if rows < 3 else (-1, 0, 1)
+    agent_idx = np.arange(n)
+    found_i = []
+    found_j = []
+    for dc in dcols:
+        for dr in drows:
+            other = ((col + dc) % cols) * rows + (row + dr) % rows
+            counts = ends[other] - starts[other]
+            total = counts.sum()
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            found_i.append(np.repeat(agent_idx, counts))
+            found_j.append(order[np.repeat(starts[other], counts) +
+                                 np.arange(total) - first])
+    pair_i = np.concatenate(found_i)
+    pair_j = np.concatenate(found_j)
+
+    diff = pos[pair_j] - pos[pair_i]
+    dist_sq = np.einsum('ij,ij->i', diff, diff)
+    keep = (dist_sq < radius[pair_i] ** 2) & (pair_i != pair_j)
+    pair_i = pair_i[keep]
+    pair_j = pair_j[keep]
+    by_agent = np.lexsort((pair_j, pair_i))
+    return pair_i[by_agent], pair_j[by_agent]
+
+
+def flocking_forces(pos, vel, heading, pair_i, pair_j, wander_force,
+                    wander_wt, align_wt, separate_wt, cohesion_wt,
+                    separate_dist=80.0):
+    ''' Combined flocking force of every agent, with the same terms and
+        weights as Agent.calculate() in 'flocking' mode. pair_i must be
+        sorted (see neighbour_pairs). Weights can be scalars or (N,) arrays.
+        Returns (force, vel): Agent.separate() pushes the agent velocity as
+        part of its result, so the pushed velocities are returned too (the
+        input vel array is left unchanged). '''
+    n = len(pos)
+
+    # neighbours at exactly our position (including ourselves) are ignored
+    keep = (pos[pair_i] != pos[pair_j]).any(axis=1)
+    pair_i = pair_i[keep]
+    pair_j = pair_j[keep]
+    count = np.bincount(pair_i, minlength=n).astype(float)
+    has = count > 0
+
+    # align: average neighbour heading, relative to our own heading
+    align = np.zeros((n, 2))
+    align[has] = (_seg_sum(heading[pair_j], pair_i, n)[has] /
+                  count[has, None] - heading[has])
+
+    # cohesion: centre of mass of the neighbours
+    center_of_mass = _seg_sum(pos[pair_j], pair_i, n)
+    center_of_mass[has] /= count[has, None]
+
+    # separate: a unit push for each close neighbour. Agent.separate() pushes
+    # vel by the running total after each neighbour, so the k-th of K close
+    # neighbours is applied K-k+1 times.
+    diff = pos[pair_i] - pos[pair_j]
+    close = np.einsum('ij,ij->i', diff, diff) < separate_dist ** 2
+    diff = diff[close]
+    close_i = pair_i[close]
+    root = np.sqrt(separate_dist)
+    push = np.empty_like(diff)
+    positive = (diff[:, 0] >= 0) | (diff[:, 1] >= 0)
+    push[:, 0] = np.where(positive, root, -root) - diff[:, 0]
+    push[:, 1] = root - diff[:, 1]
+    push = steering.normalised(push)
+    rank = np.arange(len(close_i)) - np.searchsorted(close_i, close_i)
+    repeats = np.bincount(close_i, minlength=n)[close_i] - rank
+    separate = vel - _seg_sum(push * repeats[:, None], close_i, n)
+
+    force = (_col(wander_wt) * wander_force + _col(align_wt) * align +
+             _col(separate_wt) * separate + _col(cohesion_wt) * center_of_mass)
+    return force, separate
+
+
+def flock(arrays, delta, cx, cy):
+    ''' Calculate the flocking force of every agent in an AgentArrays store,
+        writing the force and velocity columns. '''
+    a = arrays
+    n = a.count
+    pos = a.pos[:n]
+    vel = a.vel[:n]
+    pair_i, pair_j = neighbour_pairs(pos, a.neighbour_radius[:n], cx, cy)
+    wander_force = steering.wander(pos, vel, a.heading[:n], a.side[:n],
+                                   a.wander_target[:n], a.wander_dist[:n],
+                                   a.wander_radius[:n], a.wander_jitter[:n],
+                                   a.max_speed[:n], delta)
+    a.force[:n], a.vel[:n] = flocking_forces(
+        pos, vel, a.heading[:n], pair_i, pair_j, wander_force,
+        a.wander_wt[:n], a.align_wt[:n], a.separate_wt[:n],
+        a.cohesion_wt[:n])
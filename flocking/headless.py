@@ -0,0 +1,182 @@
+'''Headless simulation runner
+
+Builds a World from a scenario and steps it with a fixed delta, as fast as
+the CPU allows, without pyglet, a window or any OpenGL state (egi is never
+initialised, so it stays on the null graphics backend). Reports the ticks
+per second at the end. For example:
+
+    python headless.py --scenario flock --agents 100 --ticks 1000
+
+'''
+
+import json
+import sys
+from argparse import ArgumentParser
+from math import ceil
+from random import seed
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from profiler import profiler
+from world import World
+from agent import Agent
+
+
+def flock(world, count):
+    ''' count flocking agents at random positions (main.py uses 3) '''
+    for _ in range(count):
+        world.agents.append(Agent(world, 30.0, 1.0, 'flocking', 'GREEN'))
+
+
+def topological(world, count):
+    ''' count agents flocking with their k nearest neighbours only '''
+    for _ in range(count):
+        world.agents.append(Agent(world, 30.0, 1.0, 'topological', 'GREEN'))
+
+
+SCENARIOS = {
+    'flock': flock,
+    'topological': topological,
+}
+DEFAULT_SCENARIO = 'flock'
+DEFAULT_AGENTS = 3
+
+
+def build(scenario, agents, size=500, rand_seed=None):
+    ''' Create a world of size x size and populate it from a scenario. '''
+    if rand_seed is not None:
+        seed(rand_seed)
+    world = World(size, size)
+    SCENARIOS[scenario](world, agents)
+    world.paused = False
+    return world
+
+
+def run(world, ticks, delta, tick_times=None):
+    ''' Step the world ticks times with a fixed delta. Returns the elapsed
+        (wall clock) seconds. If a tick_times list is given, the duration of
+        each tick is appended to it. '''
+    start = perf_counter()
+    if tick_times is None:
+        for _ in range(ticks):
+            world.update(delta)
+            profiler.end_frame()
+    else:
+        last = start
+        for _ in range(ticks):
+            world.update(delta)
+            profiler.end_frame()
+            now = perf_counter()
+            tick_times.append(now - last)
+            last = now
+    return perf_counter() - start
+
+
+def peak_rss_mb():
+    ''' Peak resident memory of this process in MB (None if unknown). '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def report(scenario, world, ticks, elapsed, tick_times):
+    ''' Summary of a run as a dict (times in ms). '''
+    ordered = sorted(tick_times)
+    lists = world.neighbour_lists
+    def percentile(p):
+        return 1000.0 * ordered[max(int(ceil(p * len(ordered))) - 1, 0)]
+    return {
+        'scenario': scenario,
+        'agents': len(world.agents),
+        'ticks': ticks,
+        'elapsed': elapsed,
+        'ticks_per_sec': ticks / elapsed if elapsed > 0 else None,
+        'p50_ms': percentile(0.50) if ordered else None,
+        'p95_ms': percentile(0.95) if ordered else None,
+        'p99_ms': percentile(0.99) if ordered else None,
+        'max_ms': 1000.0 * ordered[-1] if ordered else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'rebuild_rate': lists.rebuild_rate() if lists is not None else None,
+    }
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Run a world without graphics.')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS),
+                        default=DEFAULT_SCENARIO)
+    parser.add_argument('--agents', type=int, default=DEFAULT_AGENTS,
+                        help='number of agents to create')
+    parser.add_argument('--ticks', type=int, default=1000,
+                        help='number of updates to run')
+    parser.add_argument('--delta', type=float, default=1/60.,
+                        help='fixed time step of each update (seconds)')
+    parser.add_argument('--size', type=int, default=500,
+                        help='world width and height')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='save per-phase timings to a JSON file')
+    parser.add_argument('--json', action='store_true',
+                        help='print the result (with tick latency '
+                             'percentiles and peak memory) as JSON')
+    parser.add_argument('--arrays', action='store_true',
+                        help='keep agent state in the NumPy array store')
+    parser.add_argument('--buffered', action='store_true',
+                        help='double-buffered updates (order independent '
+                        'apart from the wander jitter)')
+    parser.add_argument('--quadtree', action='store_true',
+                        help='index agents in a quadtree instead of a grid')
+    parser.add_argument('--far-field', type=float, metavar='THETA',
+                        help='approximate far away neighbours from quadtree '
+                             'aggregates, with this opening angle')
+    parser.add_argument('--radius', type=float,
+                        help='neighbour radius of every agent')
+    parser.add_argument('--symmetric', action='store_true',
+                        help='sum separation pushes once per agent pair')
+    parser.add_argument('--skin', type=float,
+                        help='use cached neighbour lists with this skin '
+                             'distance')
+    args = parser.parse_args(argv)
+
+    world = build(args.scenario, args.agents, args.size, args.seed)
+    world.double_buffered = args.buffered
+    world.symmetric_separation = args.symmetric
+    world.use_quadtree(args.quadtree)
+    if args.far_field is not None:
+        world.use_far_field(args.far_field)
+    if args.radius is not None:
+        for agent in world.agents:
+            agent.neighbour_radius = args.radius
+    if args.skin is not None:
+        world.use_neighbour_lists(args.skin)
+    if args.arrays:
+        world.use_arrays()
+        if args.seed is not None:
+            import numpy
+            numpy.random.seed(args.seed)
+    if args.profile:
+        profiler.reset(args.ticks)
+        profiler.enabled = True
+    tick_times = []
+    elapsed = run(world, args.ticks, args.delta, tick_times)
+    if args.json:
+        print(json.dumps(report(args.scenario, world, args.ticks, elapsed,
+                                tick_times)))
+    else:
+        rate = args.ticks / elapsed if elapsed > 0 else float('inf')
+        print('%s: %d ticks, %d agents, %.3f s, %.1f ticks/sec' % (
+            args.scenario, args.ticks, len(world.agents), elapsed, rate))
+        if world.neighbour_lists is not None:
+            print('neighbour lists rebuilt on %.1f%% of ticks' % (
+                100.0 * world.neighbour_lists.rebuild_rate()))
+    if args.profile:
+        profiler.dump(args.profile)
+
+
+if __name__ == '__main__':
+    main()
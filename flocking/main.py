@@ -5,11 +5,14 @@ By Clinton Woodward cwoodward@swin.edu.au
 
 '''
 from graphics import egi, KEY
-from pyglet import window, clock
+from pyglet import window, clock, app
 from pyglet.gl import *
 
 from vector2d import Vector2D
+from profiler import profiler
+from loop import FixedStepLoop
 from world import World
+from quadtree import QuadTree
 from agent import Agent, AGENT_MODES  # Agent with seek, arrive, flee and pursuit
 from random import randrange
 
@@ -22,8 +25,24 @@ def on_mouse_press(x, y, button, modifiers):
 def on_key_press(symbol, modifiers):
     if symbol == KEY.P:
         world.paused = not world.paused
+        sim.schedule(clock)
     elif symbol == KEY.N:
         world.agents.append(Agent(world, 30.0, 1.0, 'flocking', 'GREEN'))
+    # Toggle double-buffered updates (order independent, but for wander)
+    elif symbol == KEY.B:
+        world.double_buffered = not world.double_buffered
+    # Toggle the quadtree (instead of the grid) for neighbour searches
+    elif symbol == KEY.Q:
+        world.use_quadtree(not isinstance(world.grid, QuadTree))
+    # Toggle far field (Barnes-Hut) align and cohesion sums
+    elif symbol == KEY.G:
+        world.use_far_field(None if world.far_field is not None else 0.5)
+    # Toggle symmetric (once per pair) separation
+    elif symbol == KEY.S:
+        world.symmetric_separation = not world.symmetric_separation
+    # Toggle cached (Verlet) neighbour lists
+    elif symbol == KEY.V:
+        world.use_neighbour_lists(None if world.neighbour_lists else 20.0)
     elif symbol in AGENT_MODES:
         for agent in world.agents:
             agent.mode = AGENT_MODES[symbol]
@@ -32,12 +51,34 @@ def on_key_press(symbol, modifiers):
     elif symbol == KEY.I:
         for agent in world.agents:
             agent.show_info = not agent.show_info
+    # Toggle the frame timing profiler and overlay
+    elif symbol == KEY.T:
+        profiler.toggle()
+    # Toggle fixed step simulation, and interpolated rendering
+    elif symbol == KEY.F:
+        sim.toggle_fixed()
+    elif symbol == KEY.L:
+        sim.toggle_interpolate()
+    # Time warp: off, x10, x100, as fast as possible
+    elif symbol == KEY.W:
+        sim.cycle_warp()
 
 
 
 def on_resize(cx, cy):
     world.cx = cx
     world.cy = cy
+    world.static_changed()
+
+
+def on_draw():
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    sim.render()
+    # show nice FPS bottom right (default)
+    fps_display.draw()
+    if profiler.enabled:
+        profiler.render()
+    profiler.end_frame()
 
 
 if __name__ == '__main__':
@@ -54,6 +95,7 @@ if __name__ == '__main__':
     win.push_handlers(on_key_press)
     win.push_handlers(on_mouse_press)
     win.push_handlers(on_resize)
+    win.push_handlers(on_draw)
 
     # create a world for agents
     world = World(500, 500)
@@ -63,15 +105,10 @@ if __name__ == '__main__':
     world.agents.append(Agent(world, 30.0, 1.0, 'flocking', 'BLUE'))
     # unpause the world ready for movement
     world.paused = False
+    # update the world in fixed steps, whatever the render rate
+    sim = FixedStepLoop(world)
 
-    while not win.has_exit:
-        win.dispatch_events()
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        # show nice FPS bottom right (default)
-        delta = clock.tick()
-        world.update(delta)
-        world.render()
-        fps_display.draw()
-        # swap the double buffer
-        win.flip()
-
+    # tick the world from the clock, and draw when needed. Between frames,
+    # and while paused until an event arrives, the app sleeps.
+    sim.schedule(clock)
+    app.run()
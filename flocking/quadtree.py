@@ -0,0 +1,409 @@
+'''Adaptive quadtree to speed up agent neighbour searches
+
+An alternative to the uniform SpatialGrid, worth it for k nearest searches
+among crowded agents (the grid is faster otherwise, see spatial_bench.py). A
+leaf holds up to bucket_size agents and splits into four quarters when it
+gets more, so crowded areas get small cells and empty areas stay as one big
+cell.
+When agents leave, quarters holding bucket_size agents or less between them
+are merged again.
+
+The tree is kept up to date incrementally: each tick, only agents that have
+left the cell they were in are moved, and agents added to or removed from the
+world are inserted or removed. It has the same rebuild(), query() and
+nearest() methods as SpatialGrid, so World can use either (see
+World.use_quadtree).
+
+For long range flocking, each node can also keep the sums of the positions
+and headings of its agents (see update_aggregates). aggregate() then sums a
+whole node at once when it lies inside the search circle, and treats a node
+that is small compared to its distance (the Barnes-Hut opening angle) as if
+all its agents were at its centre of mass, so it only visits O(log n) nodes
+instead of every agent in range.
+
+'''
+
+from heapq import heappush, heappop, heapreplace
+
+# a bit of space around the world, for agents just over the edge
+MARGIN = 0.05
+
+
+class _Node(object):
+    ''' A square (or rectangle) of the tree: a leaf with a list of agents, or
+        a branch with four children. count is the number of agents in the
+        whole subtree, and sx, sy and hx, hy the sums of their positions and
+        headings (as of the last update_aggregates). '''
+    __slots__ = ('parent', 'x0', 'y0', 'x1', 'y1', 'mx', 'my', 'depth',
+                 'agents', 'children', 'count', 'sx', 'sy', 'hx', 'hy')
+
+    def __init__(self, parent, x0, y0, x1, y1, depth):
+        self.parent = parent
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.mx = (x0 + x1) / 2
+        self.my = (y0 + y1) / 2
+        self.depth = depth
+        self.agents = []
+        self.children = None
+        self.count = 0
+        self.sx = self.sy = self.hx = self.hy = 0.0
+
+    def contains(self, x, y):
+        return self.x0 <= x < self.x1 and self.y0 <= y < self.y1
+
+    def child_for(self, x, y):
+        ''' The child (of a branch) whose area holds x, y. '''
+        return self.children[(x >= self.mx) * 2 + (y >= self.my)]
+
+    def dist_sq(self, x, y):
+        ''' Squared distance from x, y to the nearest point of the node. '''
+        dx = max(self.x0 - x, x - self.x1, 0.0)
+        dy = max(self.y0 - y, y - self.y1, 0.0)
+        return dx*dx + dy*dy
+
+    def far_sq(self, x, y):
+        ''' Squared distance from x, y to the furthest corner of the node. '''
+        dx = max(x - self.x0, self.x1 - x)
+        dy = max(y - self.y0, self.y1 - y)
+        return dx*dx + dy*dy
+
+
+class QuadTree(object):
+    ''' A quadtree covering the world rectangle (plus a small margin).
+        Agents outside it are kept in a separate list that every search
+        checks, so searches are always correct. '''
+
+    def __init__(self, bucket_size=8, max_depth=12):
+        self.bucket_size = bucket_size
+        self.max_depth = max_depth
+        self.cell_size = None  # as given to rebuild(), see SpatialGrid
+        self.cx = None
+        self.cy = None
+        self.root = None
+        self.outside = []
+        self.leaf_of = {}  # agent -> leaf node (None when outside)
+
+    def clear(self, cx, cy):
+        ''' Remove all agents, and cover a world of size cx, cy. '''
+        self.cx = max(cx, 1)
+        self.cy = max(cy, 1)
+        mx = MARGIN * self.cx
+        my = MARGIN * self.cy
+        self.root = _Node(None, -mx, -my, self.cx + mx, self.cy + my, 0)
+        self.outside = []
+        self.leaf_of = {}
+
+    def rebuild(self, agents, cx, cy, cell_size=None):
+        ''' Bring the tree up to date with the agents list: add new agents,
+            remove agents that are gone and move agents that have left their
+            cell. If the world size (cx, cy) has changed, the tree is built
+            again from scratch. cell_size is only kept, for code written for
+            SpatialGrid. '''
+        if cell_size is not None:
+            self.cell_size = cell_size
+        if self.root is None or (max(cx, 1), max(cy, 1)) != (self.cx, self.cy):
+            self.clear(cx, cy)
+        leaf_of = self.leaf_of
+        if len(leaf_of) != len(agents) or \
+                any(agent not in leaf_of for agent in agents):
+            current = set(agents)
+            for agent in [agent for agent in leaf_of if agent not in current]:
+                self.remove(agent)
+        for agent in agents:
+            if agent in leaf_of:
+                self.move(agent)
+            else:
+                self.insert(agent)
+
+    def insert(self, agent):
+        ''' Add an agent at its current position. '''
+        x, y = agent.pos.x, agent.pos.y
+        node = self.root
+        if not node.contains(x, y):
+            self.outside.append(agent)
+            self.leaf_of[agent] = None
+            return
+        while node.children is not None:
+            node.count += 1
+            node = node.child_for(x, y)
+        node.count += 1
+        node.agents.append(agent)
+        self.leaf_of[agent] = node
+        if len(node.agents) > self.bucket_size and node.depth < self.max_depth:
+            self._split(node)
+
+    def remove(self, agent):
+        ''' Remove an agent. '''
+        node = self.leaf_of.pop(agent)
+        if node is None:
+            self.outside.remove(agent)
+            return
+        node.agents.remove(agent)
+        while node is not None:
+            node.count -= 1
+            if node.children is not None and node.count <= self.bucket_size:
+                self._merge(node)
+            node = node.parent
+
+    def move(self, agent):
+        ''' Update the tree after an agent has moved (cheap if it is still
+            inside the same cell). '''
+        leaf = self.leaf_of[agent]
+        pos = agent.pos
+        if leaf is not None and leaf.contains(pos.x, pos.y):
+            return
+        self.remove(agent)
+        self.insert(agent)
+
+    def _split(self, node):
+        x0, y0, x1, y1 = node.x0, node.y0, node.x1, node.y1
+        mx, my = node.mx, node.my
+        depth = node.depth + 1
+        # same order as child_for(): (left, low), (left, high), (right, low),
+        # (right, high)
+        node.children = [_Node(node, x0, y0, mx, my, depth),
+                         _Node(node, x0, my, mx, y1, depth),
+                         _Node(node, mx, y0, x1, my, depth),
+                         _Node(node, mx, my, x1, y1, depth)]
+        agents = node.agents
+        node.agents = []
+        leaf_of = self.leaf_of
+        for agent in agents:
+            child = node.child_for(agent.pos.x, agent.pos.y)
+            child.agents.append(agent)
+            child.count += 1
+            leaf_of[agent] = child
+        for child in node.children:
+            if len(child.agents) > self.bucket_size and \
+                    child.depth < self.max_depth:
+                self._split(child)
+
+    def _merge(self, node):
+        agents = []
+        self._collect(node, agents)
+        node.children = None
+        node.agents = agents
+        leaf_of = self.leaf_of
+        for agent in agents:
+            leaf_of[agent] = node
+
+    def _collect(self, node, result):
+        if node.children is None:
+            result.extend(node.agents)
+        else:
+            for child in node.children:
+                self._collect(child, result)
+
+    def query(self, pos, radius, wrap=False):
+        ''' Return the list of agents closer than radius to pos, including an
+            agent at pos itself. Distances are straight line by default; set
+            wrap to measure across the world edges as well (like
+            SpatialGrid.query). '''
+        x, y = pos.x, pos.y
+        r_sq = radius * radius
+        if not wrap:
+            result = []
+            self._query(self.root, x, y, r_sq, result)
+            for agent in self.outside:
+                dx = agent.pos.x - x
+                dy = agent.pos.y - y
+                if dx*dx + dy*dy < r_sq:
+                    result.append(agent)
+            return result
+        # search each copy of the circle that reaches into the world, and
+        # measure the distances across the edges
+        cx, cy = self.cx, self.cy
+        found = []
+        seen = set()
+        for ox in (0.0, -cx, cx):
+            for oy in (0.0, -cy, cy):
+                if self.root.dist_sq(x + ox, y + oy) >= r_sq:
+                    continue
+                images = []
+                self._query(self.root, x + ox, y + oy, r_sq, images)
+                for agent in images:
+                    if id(agent) not in seen:
+                        seen.add(id(agent))
+                        found.append(agent)
+        result = []
+        for agent in found + self.outside:
+            dx = abs(agent.pos.x - x) % cx
+            dy = abs(agent.pos.y - y) % cy
+            dx = min(dx, cx - dx)
+            dy = min(dy, cy - dy)
+            if dx*dx + dy*dy < r_sq:
+                result.append(agent)
+        return result
+
+    def _query(self, node, x, y, r_sq, result):
+        if node.count == 0 or node.dist_sq(x, y) >= r_sq:
+            return
+        if node.far_sq(x, y) < r_sq:
+            # the whole node is inside the circle
+            self._collect(node, result)
+            return
+        if node.children is not None:
+            for child in node.children:
+                self._query(child, x, y, r_sq, result)
+            return
+        for agent in node.agents:
+            dx = agent.pos.x - x
+            dy = agent.pos.y - y
+            if dx*dx + dy*dy < r_sq:
+                result.append(agent)
+
+    def nearest(self, pos, k, radius=None, exclude=None):
+        ''' Return the (up to) k agents nearest to pos, closest first, by
+            straight line distance (ties by agent id), like
+            SpatialGrid.nearest(). Nodes are searched closest first, until
+            the next one is further away than the k-th nearest agent found so
+            far (or radius). '''
+        if k <= 0:
+            return []
+        x, y = pos.x, pos.y
+        limit_sq = float('inf') if radius is None else radius * radius
+        worst = limit_sq  # the k-th nearest so far, once there are k
+        best = []  # heap of (-dist_sq, -id, agent), furthest at the top
+
+        def consider(agents):
+            worst_sq = worst
+            for agent in agents:
+                other = agent.pos
+                dx = other.x - x
+                dy = other.y - y
+                dist_sq = dx*dx + dy*dy
+                if dist_sq > worst_sq or dist_sq >= limit_sq or \
+                        agent is exclude:
+                    continue
+                entry = (-dist_sq, -agent.id, agent)
+                if len(best) < k:
+                    heappush(best, entry)
+                elif entry[:2] > best[0][:2]:
+                    heapreplace(best, entry)
+                else:
+                    continue
+                if len(best) == k:
+                    worst_sq = -best[0][0]
+            return worst_sq
+
+        worst = consider(self.outside)
+        # nodes to visit, closest first (ties by visit order)
+        order = 0
+        todo = [(self.root.dist_sq(x, y), order, self.root)]
+        while todo:
+            dist_sq, _, node = heappop(todo)
+            if dist_sq > worst or dist_sq >= limit_sq:
+                break
+            if node.children is None:
+                worst = consider(node.agents)
+                continue
+            for child in node.children:
+                if child.count:
+                    order += 1
+                    heappush(todo, (child.dist_sq(x, y), order, child))
+        best.sort(key=lambda entry: entry[:2], reverse=True)
+        return [agent for _, _, agent in best]
+
+    def update_aggregates(self):
+        ''' Recalculate the position and heading sums of every node, from
+            the current agent states. Call after rebuild(), before using
+            aggregate(). '''
+        self._update_aggregates(self.root)
+
+    def _update_aggregates(self, node):
+        sx = sy = hx = hy = 0.0
+        if node.children is None:
+            for agent in node.agents:
+                sx += agent.pos.x
+                sy += agent.pos.y
+                hx += agent.heading.x
+                hy += agent.heading.y
+        else:
+            for child in node.children:
+                if child.count:
+                    self._update_aggregates(child)
+                    sx += child.sx
+                    sy += child.sy
+                    hx += child.hx
+                    hy += child.hy
+        node.sx, node.sy, node.hx, node.hy = sx, sy, hx, hy
+
+    def aggregate(self, pos, radius, theta=0.5, exclude=None):
+        ''' Return (count, sum x, sum y, sum heading x, sum heading y) of
+            the agents closer than radius to pos (straight line), leaving out
+            the exclude agent. Nodes entirely inside the circle are summed
+            exactly from their aggregates. A node crossing the edge of the
+            circle whose width is less than theta times the distance to its
+            centre of mass is counted whole if that centre is in range, and
+            not at all otherwise. theta=0 only sums whole nodes, so is exact.
+            Aggregates are as of the last update_aggregates(), while agents in
+            the leaves that get searched count with their current state. '''
+        x, y = pos.x, pos.y
+        # the nodes holding exclude, whose sums include it
+        holding = set()
+        node = self.leaf_of.get(exclude)
+        while node is not None:
+            holding.add(node)
+            node = node.parent
+        sums = [0, 0.0, 0.0, 0.0, 0.0]
+        self._aggregate(self.root, x, y, radius * radius, theta * theta,
+                        exclude, holding, sums)
+        r_sq = radius * radius
+        for agent in self.outside:
+            dx = agent.pos.x - x
+            dy = agent.pos.y - y
+            if dx*dx + dy*dy < r_sq and agent is not exclude:
+                self._add(sums, agent)
+        return tuple(sums)
+
+    def _aggregate(self, node, x, y, r_sq, theta_sq, exclude, holding,
+                   sums):
+        count = node.count
+        if count == 0 or node.dist_sq(x, y) >= r_sq:
+            return
+        whole = node.far_sq(x, y) < r_sq
+        if not whole and node.children is not None:
+            # far enough away (for its size) to use its centre of mass?
+            dx = node.sx / count - x
+            dy = node.sy / count - y
+            dist_sq = dx*dx + dy*dy
+            width = node.x1 - node.x0
+            if width * width < theta_sq * dist_sq:
+                if dist_sq >= r_sq:
+                    return
+                whole = True
+        if whole:
+            sums[0] += count
+            sums[1] += node.sx
+            sums[2] += node.sy
+            sums[3] += node.hx
+            sums[4] += node.hy
+            if node in holding:
+                # take exclude back out (its state has not changed since
+                # the update, if it is the agent searching)
+                sums[0] -= 1
+                sums[1] -= exclude.pos.x
+                sums[2] -= exclude.pos.y
+                sums[3] -= exclude.heading.x
+                sums[4] -= exclude.heading.y
+            return
+        if node.children is not None:
+            for child in node.children:
+                self._aggregate(child, x, y, r_sq, theta_sq, exclude,
+                                holding, sums)
+            return
+        for agent in node.agents:
+            dx = agent.pos.x - x
+            dy = agent.pos.y - y
+            if dx*dx + dy*dy < r_sq and agent is not exclude:
+                self._add(sums, agent)
+
+    def _add(self, sums, agent):
+        sums[0] += 1
+        sums[1] += agent.pos.x
+        sums[2] += agent.pos.y
+        sums[3] += agent.heading.x
+        sums[4] += agent.heading.y
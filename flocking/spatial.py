@@ -0,0 +1,275 @@
+'''Uniform spatial hash grid to speed up agent neighbour searches
+
+The grid buckets agents into cells that are at least as big as the search
+radius, so finding the neighbours of an agent only needs to look at the
+cells around it instead of every agent in the world. The k nearest agents
+are found by searching rings of cells outwards, stopping as soon as no
+further cell can hold anything closer.
+
+NeighbourLists caches a short candidate list per agent on top of the grid, so
+the grid and the lists only need rebuilding every few ticks.
+
+'''
+
+from heapq import heappush, heapreplace
+from math import ceil
+from operator import attrgetter
+
+
+class SpatialGrid(object):
+    ''' A grid of cells that exactly covers the world rectangle. Cell indices
+        wrap at the edges, matching the toroidal space of World.wrap_around(),
+        so a search near one edge also visits the cells on the opposite edge.
+        The grid is rebuilt from scratch (cheap) once per update tick. '''
+
+    def __init__(self, cell_size=150.0):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.cols = 1
+        self.rows = 1
+        self.cell_w = cell_size
+        self.cell_h = cell_size
+        self.cx = cell_size
+        self.cy = cell_size
+
+    def rebuild(self, agents, cx, cy, cell_size=None):
+        ''' Clear the grid and bucket all agents by their current position.
+            The world size (cx, cy) is passed each time so the grid follows
+            window resizes. '''
+        if cell_size is not None:
+            self.cell_size = cell_size
+        self.cx = max(cx, 1)
+        self.cy = max(cy, 1)
+        # whole number of cells across the world, each at least cell_size
+        self.cols = max(1, int(self.cx // self.cell_size))
+        self.rows = max(1, int(self.cy // self.cell_size))
+        self.cell_w = self.cx / self.cols
+        self.cell_h = self.cy / self.rows
+
+        cells = self.cells = {}
+        for agent in agents:
+            key = self.cell_of(agent.pos)
+            bucket = cells.get(key)
+            if bucket is None:
+                cells[key] = [agent]
+            else:
+                bucket.append(agent)
+
+    def cell_of(self, pos):
+        ''' Return the (col, row) key of the cell containing pos. Positions
+            outside the world rectangle wrap back into it. '''
+        return (int(pos.x // self.cell_w) % self.cols,
+                int(pos.y // self.cell_h) % self.rows)
+
+    def buckets_near(self, pos, radius):
+        ''' Yield each (non-empty) cell bucket that could hold an agent within
+            radius of pos. Each cell is visited once, even when the search
+            area wraps all the way around a small world. '''
+        col, row = self.cell_of(pos)
+        cols = self._span(col, int(ceil(radius / self.cell_w)), self.cols)
+        rows = self._span(row, int(ceil(radius / self.cell_h)), self.rows)
+        cells = self.cells
+        for c in cols:
+            for r in rows:
+                bucket = cells.get((c, r))
+                if bucket:
+                    yield bucket
+
+    def _span(self, idx, rings, count):
+        if 2 * rings + 1 >= count:
+            return range(count)
+        return [(idx + d) % count for d in range(-rings, rings + 1)]
+
+    def query(self, pos, radius, wrap=False):
+        ''' Return the list of agents closer than radius to pos, including an
+            agent at pos itself. Distances are straight line by default (as
+            the brute force search has always done); set wrap to measure
+            across the world edges as well. '''
+        x, y = pos.x, pos.y
+        r_sq = radius * radius
+        cx, cy = self.cx, self.cy
+        result = []
+        for bucket in self.buckets_near(pos, radius):
+            for agent in bucket:
+                dx = agent.pos.x - x
+                dy = agent.pos.y - y
+                if wrap:
+                    dx = abs(dx) % cx
+                    dy = abs(dy) % cy
+                    dx = min(dx, cx - dx)
+                    dy = min(dy, cy - dy)
+                if dx*dx + dy*dy < r_sq:
+                    result.append(agent)
+        return result
+
+    def nearest(self, pos, k, radius=None, exclude=None):
+        ''' Return the (up to) k agents nearest to pos, closest first, by
+            straight line distance (ties by agent id). If radius is given,
+            only agents closer than radius count. exclude is an agent to leave
+            out, usually the one searching. Cells are searched in rings
+            around the cell of pos, until the next ring is further away than
+            the k-th nearest agent found so far (or radius). '''
+        if k <= 0:
+            return []
+        x, y = pos.x, pos.y
+        limit_sq = float('inf') if radius is None else radius * radius
+        worst = limit_sq  # the k-th nearest so far, once there are k
+        col, row = self.cell_of(pos)
+        cols, rows = self.cols, self.rows
+        cell = min(self.cell_w, self.cell_h)
+        cells = self.cells
+        visited = set()
+        best = []  # heap of (-dist_sq, -id, agent), furthest at the top
+        for ring in range(max(cols, rows) // 2 + 1):
+            # anything in this ring is at least this far from pos
+            near = (ring - 1) * cell
+            if near > 0 and near * near >= worst:
+                break
+            # rings wrapping around a small grid can meet cells again
+            wraps = 2 * ring + 1 > min(cols, rows)
+            if wraps and not visited:
+                for inner in range(ring):
+                    visited.update(self._ring(col, row, inner))
+            for key in self._ring(col, row, ring):
+                if wraps:
+                    if key in visited:
+                        continue
+                    visited.add(key)
+                bucket = cells.get(key)
+                if not bucket:
+                    continue
+                for agent in bucket:
+                    other = agent.pos
+                    dx = other.x - x
+                    dy = other.y - y
+                    dist_sq = dx*dx + dy*dy
+                    if dist_sq > worst or dist_sq >= limit_sq or \
+                            agent is exclude:
+                        continue
+                    entry = (-dist_sq, -agent.id, agent)
+                    if len(best) < k:
+                        heappush(best, entry)
+                    elif entry[:2] > best[0][:2]:
+                        heapreplace(best, entry)
+                    else:
+                        continue
+                    if len(best) == k:
+                        worst = -best[0][0]
+        best.sort(key=lambda entry: entry[:2], reverse=True)
+        return [agent for _, _, agent in best]
+
+    def _ring(self, col, row, ring):
+        ''' Yield the (col, row) keys of the cells ring cells away from
+            (col, row), wrapping at the edges (keys can repeat when the ring
+            wraps around a small grid). '''
+        cols, rows = self.cols, self.rows
+        if ring == 0:
+            yield (col, row)
+            return
+        for d in range(-ring, ring + 1):
+            yield ((col + d) % cols, (row - ring) % rows)
+            yield ((col + d) % cols, (row + ring) % rows)
+        for d in range(-ring + 1, ring):
+            yield ((col - ring) % cols, (row + d) % rows)
+            yield ((col + ring) % cols, (row + d) % rows)
+
+
+class NeighbourLists(object):
+    ''' Verlet neighbour lists. Each agent keeps a list of the agents within
+        its neighbour radius plus a "skin" distance, found with the grid.
+        Searches only filter that short list by the current distances, and
+        the lists are only rebuilt once some agent has moved more than half
+        the skin since the last build (before then, no agent outside a list
+        can have come within the neighbour radius). Lists are sorted by
+        agent id, so neighbours come back in creation order.
+
+        Lists and moves are measured across the world edges, so an agent
+        wrapping around the edge is a short move, not a rebuild. Searches
+        still use straight line distances, like the grid search.
+
+        builds and ticks count list rebuilds and update calls, for the
+        rebuild rate. '''
+
+    def __init__(self, grid, skin=20.0):
+        self.grid = grid
+        self.skin = skin
+        self.lists = {}  # agent -> candidate neighbours
+        self.origins = []  # (agent, x, y) at the last build
+        self.agents = []
+        self.radii = []  # each agent's neighbour_radius at the last build
+        self.radius = None
+        self.builds = 0
+        self.ticks = 0
+
+    def update(self, agents, cx, cy, delta=0.0):
+        ''' Call once per tick, before any searches. Rebuilds the lists if
+            an agent may have moved too far (allowing for each agent moving
+            up to max_speed * delta during the tick), or if the agents or
+            any agent's neighbour_radius have changed. Returns True if the
+            lists were rebuilt. '''
+        self.ticks += 1
+        if agents == self.agents and not self.moved_too_far(delta, cx, cy) \
+                and self.radii == [agent.neighbour_radius for agent in agents]:
+            return False
+        self.rebuild(agents, cx, cy)
+        return True
+
+    def max_radius(self, agents):
+        if not agents:
+            return None
+        return max(agent.neighbour_radius for agent in agents)
+
+    def moved_too_far(self, delta, cx, cy):
+        ''' True if any agent may move more than half the skin from where it
+            was at the last build, by the end of this tick. '''
+        if not self.origins:
+            return False
+        max_step = max(agent.max_speed for agent, _, _ in self.origins) * delta
+        limit = 0.5 * self.skin - max_step
+        if limit <= 0:
+            return True
+        limit_sq = limit * limit
+        for agent, x, y in self.origins:
+            dx = abs(agent.pos.x - x) % cx
+            dy = abs(agent.pos.y - y) % cy
+            dx = min(dx, cx - dx)
+            dy = min(dy, cy - dy)
+            if dx*dx + dy*dy > limit_sq:
+                return True
+        return False
+
+    def rebuild(self, agents, cx, cy):
+        ''' Rebuild the grid and every agent's list from scratch. '''
+        skin = self.skin
+        self.radius = self.max_radius(agents)
+        cell_size = None if self.radius is None else self.radius + skin
+        self.grid.rebuild(agents, cx, cy, cell_size)
+        by_id = attrgetter('id')
+        lists = self.lists = {}
+        for agent in agents:
+            found = self.grid.query(agent.pos, agent.neighbour_radius + skin,
+                                    wrap=True)
+            found.sort(key=by_id)
+            lists[agent] = found
+        self.origins = [(agent, agent.pos.x, agent.pos.y) for agent in agents]
+        self.agents = list(agents)
+        self.radii = [agent.neighbour_radius for agent in agents]
+        self.builds += 1
+
+    def query(self, agent):
+        ''' Return the agents closer than neighbour_radius to the agent
+            (including itself), like SpatialGrid.query(). '''
+        pos = agent.pos
+        x, y = pos.x, pos.y
+        r_sq = agent.neighbour_radius * agent.neighbour_radius
+        result = []
+        for other in self.lists[agent]:
+            dx = other.pos.x - x
+            dy = other.pos.y - y
+            if dx*dx + dy*dy < r_sq:
+                result.append(other)
+        return result
+
+    def rebuild_rate(self):
+        ''' Fraction of updates that rebuilt the lists. '''
+        return self.builds / self.ticks if self.ticks else 0.0
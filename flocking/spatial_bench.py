@@ -0,0 +1,195 @@
+'''Benchmark of the spatial indexes on different agent layouts
+
+Times the uniform SpatialGrid and the adaptive QuadTree against a brute force
+scan of all agents, on three layouts of agent positions:
+
+    uniform     spread evenly over the world
+    clustered   a few tight groups
+    blob        one tight group in the middle (a collapsed flock)
+
+For each index and layout, it times an update (every agent moves a little,
+then the index is rebuilt or updated), a range query around every agent and
+a k nearest query around every agent, and checks the results against the
+brute force ones. For example:
+
+    python spatial_bench.py --agents 1000 10000 --radius 50 --k 7
+
+'''
+
+import json
+import random
+from argparse import ArgumentParser
+from heapq import nsmallest
+from time import perf_counter
+
+from vector2d import Vector2D
+from spatial import SpatialGrid
+from quadtree import QuadTree
+
+
+class _Point(object):
+    ''' Stands in for an agent: all the indexes need is pos and id. '''
+    __slots__ = ('id', 'pos')
+
+    def __init__(self, id, x, y):
+        self.id = id
+        self.pos = Vector2D(x, y)
+
+
+class BruteForce(object):
+    ''' Scan every agent, with the same methods as SpatialGrid. '''
+
+    def rebuild(self, agents, cx, cy, cell_size=None):
+        self.agents = agents
+
+    def query(self, pos, radius, wrap=False):
+        x, y = pos.x, pos.y
+        r_sq = radius * radius
+        result = []
+        for agent in self.agents:
+            dx = agent.pos.x - x
+            dy = agent.pos.y - y
+            if dx*dx + dy*dy < r_sq:
+                result.append(agent)
+        return result
+
+    def nearest(self, pos, k, radius=None, exclude=None):
+        x, y = pos.x, pos.y
+        limit_sq = float('inf') if radius is None else radius * radius
+        found = []
+        for agent in self.agents:
+            dx = agent.pos.x - x
+            dy = agent.pos.y - y
+            dist_sq = dx*dx + dy*dy
+            if dist_sq < limit_sq and agent is not exclude:
+                found.append((dist_sq, agent.id, agent))
+        found = nsmallest(k, found, key=lambda entry: entry[:2])
+        return [agent for _, _, agent in found]
+
+
+INDEXES = {
+    'brute': BruteForce,
+    'grid': SpatialGrid,
+    'quadtree': QuadTree,
+}
+
+
+def uniform(count, size):
+    return [(random.uniform(0, size), random.uniform(0, size))
+            for _ in range(count)]
+
+
+def clustered(count, size, groups=8, spread=0.03):
+    centres = uniform(groups, size)
+    result = []
+    for i in range(count):
+        x, y = centres[i % groups]
+        result.append((random.gauss(x, spread * size) % size,
+                       random.gauss(y, spread * size) % size))
+    return result
+
+
+def blob(count, size, spread=0.03):
+    return [(random.gauss(size / 2, spread * size) % size,
+             random.gauss(size / 2, spread * size) % size)
+            for _ in range(count)]
+
+
+LAYOUTS = {
+    'uniform': uniform,
+    'clustered': clustered,
+    'blob': blob,
+}
+
+
+def jitter(points, size, step):
+    ''' Move every point a little (staying inside the world). '''
+    for point in points:
+        pos = point.pos
+        pos.x = min(max(pos.x + random.uniform(-step, step), 0.0), size)
+        pos.y = min(max(pos.y + random.uniform(-step, step), 0.0), size)
+
+
+def bench(index, points, args):
+    ''' Time one index on one layout. Returns a dict of timings (ms per
+        call) and the query results, to check. '''
+    size = args.size
+    index.rebuild(points, size, size, args.radius)
+    start = perf_counter()
+    for _ in range(args.updates):
+        jitter(points, size, args.step)
+        index.rebuild(points, size, size, args.radius)
+    update = perf_counter() - start
+
+    start = perf_counter()
+    ranges = [index.query(point.pos, args.radius) for point in points]
+    query = perf_counter() - start
+
+    start = perf_counter()
+    nearest = [index.nearest(point.pos, args.k, exclude=point)
+               for point in points]
+    knn = perf_counter() - start
+    return {
+        'update_ms': 1000.0 * update / max(args.updates, 1),
+        'query_ms': 1000.0 * query,
+        'nearest_ms': 1000.0 * knn,
+    }, ranges, nearest
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Benchmark the spatial indexes.')
+    parser.add_argument('--agents', type=int, nargs='+',
+                        default=[100, 1000, 5000])
+    parser.add_argument('--layouts', nargs='+', choices=sorted(LAYOUTS),
+                        default=['uniform', 'clustered', 'blob'])
+    parser.add_argument('--indexes', nargs='+', choices=sorted(INDEXES),
+                        default=['brute', 'grid', 'quadtree'])
+    parser.add_argument('--size', type=float, default=500.0,
+                        help='world width and height')
+    parser.add_argument('--radius', type=float, default=50.0,
+                        help='range query radius (and grid cell size)')
+    parser.add_argument('--k', type=int, default=7,
+                        help='number of nearest neighbours to find')
+    parser.add_argument('--updates', type=int, default=10,
+                        help='number of move and update rounds to time')
+    parser.add_argument('--step', type=float, default=1.0,
+                        help='largest move of an agent in each round')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='save the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    rows = []
+    print('%-10s %7s %-9s %10s %10s %10s  %s' % (
+        'layout', 'agents', 'index', 'update ms', 'range ms', 'knn ms',
+        'results'))
+    for layout in args.layouts:
+        for count in args.agents:
+            reference = None
+            for name in args.indexes:
+                # every index gets the same positions and moves
+                random.seed(args.seed)
+                points = [_Point(i, x, y) for i, (x, y) in
+                          enumerate(LAYOUTS[layout](count, args.size))]
+                times, ranges, nearest = bench(INDEXES[name](), points, args)
+                results = ([sorted(agent.id for agent in found)
+                            for found in ranges],
+                           [[agent.id for agent in found]
+                            for found in nearest])
+                if reference is None:
+                    reference = results
+                    check = 'reference'
+                else:
+                    check = 'ok' if results == reference else 'MISMATCH'
+                row = dict(layout=layout, agents=count, index=name,
+                           check=check, **times)
+                rows.append(row)
+                print('%-10s %7d %-9s %10.2f %10.2f %10.2f  %s' % (
+                    layout, count, name, row['update_ms'], row['query_ms'],
+                    row['nearest_ms'], check))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
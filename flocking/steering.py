@@ -0,0 +1,84 @@
+'''Batch steering behaviours using NumPy
+
+Vectorised versions of the Agent seek, flee, arrive and wander behaviours, to
+steer a whole flock (or horde) in one call. Each function takes (N,2) arrays
+of agent positions, velocities etc. and returns an (N,2) array of steering
+forces, one row per agent. Targets can be an (N,2) array or a single (2,)
+position shared by all agents, and scalar parameters such as max_speed can be
+a single value or an (N,) array of per-agent values.
+
+'''
+
+import numpy as np
+
+
+def _col(value):
+    ''' Shape a scalar or (N,) parameter to broadcast over (N,2) rows. '''
+    value = np.asarray(value, dtype=float)
+    return value[:, None] if value.ndim == 1 else value
+
+
+def _length(vecs):
+    ''' return the length of each row vector '''
+    return np.sqrt(np.einsum('ij,ij->i', vecs, vecs))
+
+
+def normalised(vecs):
+    ''' return unit length copies of the row vectors. Zero length rows stay
+        zero, like Vector2D.normalise() '''
+    length = _length(vecs)
+    return vecs / np.where(length > 0, length, 1.0)[:, None]
+
+
+def seek(pos, vel, target_pos, max_speed):
+    ''' move towards target positions '''
+    desired_vel = normalised(target_pos - pos) * _col(max_speed)
+    return desired_vel - vel
+
+
+def flee(pos, vel, hunter_pos, max_speed, panic_dist=150.0):
+    ''' move away from hunter positions, for agents within panic_dist '''
+    from_hunter = pos - hunter_pos
+    force = normalised(from_hunter) * _col(max_speed) - vel
+    force[_length(from_hunter) > panic_dist] = 0.0
+    return force
+
+
+def arrive(pos, vel, target_pos, max_speed, decel_rate):
+    ''' this behaviour is similar to seek() but it attempts to arrive at
+        the target positions with a zero velocity. decel_rate is a value from
+        Agent.DECELERATION_SPEEDS (or an (N,) array of them) '''
+    to_target = target_pos - pos
+    dist = _length(to_target)
+    # speed required to reach the target given the deceleration rate,
+    # limited to the max
+    speed = np.minimum(dist / np.asarray(decel_rate, dtype=float), max_speed)
+    # scale to_target to the desired speed (no need to normalise first)
+    scale = np.zeros_like(dist)
+    np.divide(speed, dist, out=scale, where=dist > 0)
+    force = to_target * scale[:, None] - vel
+    force[dist <= 0] = 0.0
+    return force
+
+
+def wander(pos, vel, heading, side, wander_target, wander_dist,
+           wander_radius, wander_jitter, max_speed, delta, jitter_range=1.0,
+           rng=np.random):
+    ''' random wandering using projected jitter circles. wander_target is the
+        (N,2) array of local wander targets, and is updated in place.
+        jitter_range is the half width of the random jitter added each call
+        (1.0 for most agents, the hiding agents use 0.5) '''
+    # this behaviour is dependent on the update rate
+    jitter_tts = _col(wander_jitter) * delta
+    # add a small random vector to each target, re-project it back on to a
+    # unit circle and scale it up to the radius of the wander circle
+    wander_target += rng.uniform(-jitter_range, jitter_range,
+                                 wander_target.shape) * jitter_tts
+    wander_target[:] = normalised(wander_target) * _col(wander_radius)
+    # move the targets wander_dist in front of the agents, and project them
+    # into world space (pos + forward * local x + side * local y)
+    local_x = wander_target[:, 0] + np.asarray(wander_dist, dtype=float)
+    local_y = wander_target[:, 1]
+    wld_target = pos + heading * local_x[:, None] + side * local_y[:, None]
+    # and steer towards them
+    return seek(pos, vel, wld_target, max_speed)
@@ -0,0 +1,142 @@
+'''Parameter sweep of the flocking weights
+
+Runs a headless flocking world for every combination of the given parameter
+values, spread over a pool of worker processes (one per core by default), and
+writes one table of summary metrics (one row per run) to a CSV or JSON file,
+depending on the file extension. For example:
+
+    python sweep.py --align 0.5 1 2 --cohesion 0 1 --ticks 500 --out sweep.csv
+
+Each run is independent, so runs scale across cores. Every parameter set is
+run with the same seeds (--seed, --seed + 1, ... for --replicates runs), so
+all sets start from the same agent states and their rows can be compared,
+and a sweep can be repeated exactly.
+
+'''
+
+import csv
+import json
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from math import sqrt
+
+from headless import build, run
+
+# command line option -> agent attribute
+PARAMS = (
+    ('wander', 'wander_wt'),
+    ('align', 'align_wt'),
+    ('cohesion', 'cohesion_wt'),
+    ('separate', 'separate_wt'),
+    ('radius', 'neighbour_radius'),
+)
+METRICS = ('polarization', 'mean_nn_distance', 'ticks_per_sec')
+
+
+def polarization(world):
+    ''' Length of the average heading: 1.0 when all agents head the same way,
+        near 0.0 when headings are random. '''
+    n = len(world.agents)
+    if n == 0:
+        return 0.0
+    x = sum(agent.heading.x for agent in world.agents) / n
+    y = sum(agent.heading.y for agent in world.agents) / n
+    return sqrt(x*x + y*y)
+
+
+def mean_nn_distance(world):
+    ''' Average distance from each agent to its nearest other agent. Uses the
+        world grid, widening the search until another agent is found. '''
+    agents = world.agents
+    if len(agents) < 2:
+        return 0.0
+    world.rebuild_grid()
+    limit = sqrt(world.cx**2 + world.cy**2)
+    total = 0.0
+    for agent in agents:
+        radius = world.grid.cell_size
+        while True:
+            found = [agent.pos.distance(other.pos)
+                     for other in world.grid.query(agent.pos, radius)
+                     if other is not agent]
+            if found or radius > limit:
+                break
+            radius *= 2
+        total += min(found) if found else limit
+    return total / len(agents)
+
+
+def run_one(job):
+    ''' Worker: run one parameter set and return its row of results. '''
+    values, agents, ticks, delta, size, rand_seed, arrays = job
+    world = build('flock', agents, size, rand_seed)
+    for agent in world.agents:
+        for (_, attr), value in zip(PARAMS, values):
+            setattr(agent, attr, value)
+    if arrays:
+        import numpy
+        numpy.random.seed(rand_seed)
+        world.use_arrays()
+    elapsed = run(world, ticks, delta)
+
+    row = dict((attr, value) for (_, attr), value in zip(PARAMS, values))
+    row['seed'] = rand_seed
+    row['polarization'] = polarization(world)
+    row['mean_nn_distance'] = mean_nn_distance(world)
+    row['ticks_per_sec'] = ticks / elapsed if elapsed > 0 else float('inf')
+    return row
+
+
+def write_table(rows, path):
+    ''' Save the result rows as JSON (.json) or CSV (anything else). '''
+    with open(path, 'w', newline='') as f:
+        if path.lower().endswith('.json'):
+            json.dump(rows, f, indent=2)
+        else:
+            fields = [attr for _, attr in PARAMS] + ['seed'] + list(METRICS)
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Sweep flocking parameters.')
+    parser.add_argument('--wander', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--align', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--cohesion', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--separate', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--radius', type=float, nargs='+', default=[150.0],
+                        help='neighbour radius values')
+    parser.add_argument('--agents', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=500)
+    parser.add_argument('--delta', type=float, default=1/60.)
+    parser.add_argument('--size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the first replicate (replicate n uses '
+                             'seed + n, for every parameter set)')
+    parser.add_argument('--replicates', type=int, default=1,
+                        help='runs of each parameter set, with different '
+                             'seeds')
+    parser.add_argument('--arrays', action='store_true',
+                        help='use the NumPy array store in each run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--out', default='sweep.csv',
+                        help='result file (.csv or .json)')
+    args = parser.parse_args(argv)
+
+    grid = product(*[getattr(args, option) for option, _ in PARAMS])
+    jobs = [(values, args.agents, args.ticks, args.delta, args.size,
+             args.seed + replicate, args.arrays)
+            for values in grid for replicate in range(args.replicates)]
+    print('%d runs on %d workers' % (len(jobs), args.workers))
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        rows = list(pool.map(run_one, jobs))
+    write_table(rows, args.out)
+    print('results saved to %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -91,6 +91,17 @@ class Vector2D(object):
             self.normalise()  # unit vector length = 1.0
             self *= maxlength  # so length is 1.0 * maxlength
 
+    def truncate_length(self, maxlength):
+        ''' truncate() that also returns the (new) length of self '''
+        x = self.x
+        y = self.y
+        l = sqrt(x*x + y*y)
+        if l > maxlength:
+            self.x = x / l * maxlength
+            self.y = y / l * maxlength
+            return maxlength
+        return l
+
     def distance(self, v2):
         ''' the distance between self and v2 vector '''
         dx = v2.x - self.x
@@ -120,6 +131,54 @@ class Vector2D(object):
         ''' Simple copy Vector2D with self values '''
         return Vector2D(self.x, self.y)
 
+    # In place versions of the common operators. These update self (or the
+    # given result vector) instead of creating new Vector2D objects, for the
+    # per agent, per frame code.
+
+    def set(self, x, y):
+        ''' set x and y, returns self '''
+        self.x = x
+        self.y = y
+        return self
+
+    def set_from(self, v):
+        ''' copy the values of v into self, returns self '''
+        self.x = v.x
+        self.y = v.y
+        return self
+
+    def set_diff(self, a, b):
+        ''' set self to a - b, returns self '''
+        self.x = a.x - b.x
+        self.y = a.y - b.y
+        return self
+
+    def add_scaled(self, v, scale):
+        ''' self += v * scale, returns self '''
+        self.x += v.x * scale
+        self.y += v.y * scale
+        return self
+
+    def normalise_into(self, result):
+        ''' store a normalised copy of self in result (self is unchanged).
+            Returns the length of self. '''
+        x = self.x
+        y = self.y
+        l = sqrt(x*x + y*y)
+        try:
+            result.x = x/l
+            result.y = y/l
+        except ZeroDivisionError:
+            result.x = 0.
+            result.y = 0.
+        return l
+
+    def perp_into(self, result):
+        ''' store the perp() of self in result, returns result '''
+        result.x = -self.y
+        result.y = self.x
+        return result
+
     def __iadd__(self, rhs):  # +=
         self.x += rhs.x
         self.y += rhs.y
@@ -4,9 +4,13 @@ Created for COS30002 AI for Games by Clinton Woodward cwoodward@swin.edu.au
 
 '''
 
+from math import sqrt
 from vector2d import Vector2D
 from matrix33 import Matrix33
 from graphics import egi
+from profiler import profiler
+from spatial import SpatialGrid, NeighbourLists
+from quadtree import QuadTree
 
 
 class World(object):
@@ -18,46 +22,347 @@ class World(object):
         self.agents = []
         self.paused = True
         self.show_info = True
+        # agent modes info text (see mode_summary)
+        self.modes_changed = True
+        self.mode_text = ''
+        self.mode_count = 0
+        # static geometry layers, drawn from a recording (see add_static)
+        self.static_layers = {}
+        self.static_dirty = set()
+        # the border walls, shared by all agents
+        self.walls = [
+            Vector2D(10.0,490.0),
+            Vector2D(490.0,490.0),
+            Vector2D(490.0,10.0),
+            Vector2D(10.0,10.0)
+        ]
+        self.add_static('walls', self.render_walls)
+        # spatial index for neighbour searches, rebuilt each tick (a
+        # SpatialGrid, or a QuadTree, see use_quadtree)
+        self.grid = SpatialGrid()
+        # optional cached neighbour lists (see use_neighbour_lists)
+        self.neighbour_lists = None
+        # Barnes-Hut opening angle, or None for exact flocking sums (see
+        # use_far_field)
+        self.far_field = None
+        # separation forces summed once per pair (see separate_pairs), and
+        # whether that was done this tick
+        self.symmetric_separation = False
+        self.pairs_separated = False
+        # optional structure-of-arrays agent state, and its flocking kernel
+        # (see use_arrays)
+        self.arrays = None
+        self.flock = None
+        # read previous tick state only (see update_buffered)
+        self.double_buffered = False
 
     def update(self, delta):
         if not self.paused:
+            with profiler.phase('update'):
+                # the array store flocking kernel finds its own neighbours
+                kernel = self.arrays is not None and \
+                    all(agent.mode == 'flocking' for agent in self.agents)
+                if not kernel:
+                    with profiler.phase('grid'):
+                        self.update_grid(delta)
+                # the array store kernel does its own separation
+                self.pairs_separated = False
+                if self.symmetric_separation and self.arrays is None:
+                    flocking = [agent for agent in self.agents
+                                if agent.mode == 'flocking']
+                    if flocking:
+                        with profiler.phase('separate'):
+                            self.separate_pairs(flocking)
+                        self.pairs_separated = True
+                if self.arrays is not None:
+                    self.update_arrays(delta, kernel)
+                elif self.double_buffered:
+                    self.update_buffered(delta)
+                else:
+                    for agent in self.agents:
+                        agent.update(delta)
+
+    def update_grid(self, delta):
+        ''' Bring the neighbour lists, spatial index and far field aggregates
+            up to date for the neighbour searches of this tick. '''
+        topological = self.topological_count()
+        lists = self.neighbour_lists
+        if lists is not None and self.lists_needed():
+            lists.update(self.agents, self.cx, self.cy, delta)
+        else:
+            lists = None
+        # k nearest searches need the grid up to date
+        if lists is None or topological or self.far_field is not None:
+            self.rebuild_grid(topological)
+        if self.far_field is not None:
+            self.grid.update_aggregates()
+
+    def update_buffered(self, delta):
+        ''' Double-buffered update. Every agent first calculates its steering
+            force from the state all agents had at the start of the tick,
+            then every agent integrates its force into its next state. Apart
+            from the wander jitter, the result does not depend on the order
+            of the agents list: wander() draws from the shared random module
+            in list order.
+
+            An agent only reads the pos and heading of other agents, and only
+            writes its own state, so each phase can be split into chunks of
+            agents (see calculate_agents and integrate_agents) and run by
+            separate workers without locks. '''
+        with profiler.phase('calculate'):
+            self.calculate_agents(self.agents, delta)
+        with profiler.phase('integrate'):
+            self.integrate_agents(self.agents, delta)
+
+    def calculate_agents(self, agents, delta):
+        ''' Read phase: set the force of each of the given agents. '''
+        for agent in agents:
+            agent.calculate(delta)
+
+    def integrate_agents(self, agents, delta):
+        ''' Write phase: apply the force of each of the given agents. '''
+        for agent in agents:
+            agent.integrate(delta)
+
+    def update_arrays(self, delta, kernel):
+        ''' Array store update: if kernel is set (every agent is flocking),
+            the forces of all agents are calculated at once by the vectorised
+            flocking kernel. Otherwise each agent calculates its own steering
+            force (the force vectors are views into the store). Then all
+            agents are integrated together as whole-array operations. Like
+            update_buffered, all forces come from the state at the start of
+            the tick. '''
+        self.arrays.sync(self.agents)
+        with profiler.phase('calculate'):
+            if kernel:
+                self.flock(self.arrays, delta, self.cx, self.cy)
+            else:
+                for agent in self.agents:
+                    agent.calculate(delta)
+        with profiler.phase('integrate'):
+            self.arrays.integrate(delta, self.cx, self.cy)
+
+    def use_arrays(self, enable=True):
+        ''' Keep agent motion state in a NumPy AgentArrays store (enable=True)
+            or in separate Vector2D objects per agent (enable=False). '''
+        if enable:
+            if self.arrays is None:
+                # numpy is optional, only loaded for the array store
+                try:
+                    from agent_arrays import AgentArrays
+                    from flock import flock
+                except ImportError:
+                    raise RuntimeError('numpy is needed for the agent array store')
+                self.flock = flock
+                self.arrays = AgentArrays()
+                self.arrays.sync(self.agents)
+        elif self.arrays is not None:
+            self.arrays.clear()
+            self.arrays = None
+            # the cached shapes may be from an older store generation
             for agent in self.agents:
-                agent.update(delta)
+                agent.shape_dirty = True
+
+    def use_neighbour_lists(self, skin=20.0):
+        ''' Find neighbours from Verlet lists with the given skin distance,
+            rebuilt only when agents have moved far enough (see
+            NeighbourLists), instead of searching the grid every tick. A skin
+            of None goes back to the grid search. '''
+        if skin is None:
+            self.neighbour_lists = None
+        else:
+            self.neighbour_lists = NeighbourLists(self.grid, skin)
+
+    def use_quadtree(self, enable=True):
+        ''' Index agents for neighbour searches in an adaptive QuadTree
+            (enable=True) or in a uniform SpatialGrid (enable=False). The
+            quadtree only pays off for k nearest searches ('topological'
+            agents) with the agents crowded into one blob. Radius searches
+            are slower than with the grid on every layout, 2-3 times on
+            uniform and clustered ones (see spatial_bench.py). '''
+        if enable == isinstance(self.grid, QuadTree):
+            return
+        if not enable:
+            self.far_field = None
+        self.grid = QuadTree() if enable else SpatialGrid()
+        if self.neighbour_lists is not None:
+            self.use_neighbour_lists(self.neighbour_lists.skin)
+
+    def use_far_field(self, theta=0.5):
+        ''' Let 'flocking' agents sum the headings and positions of their
+            neighbours (for align and cohesion) from quadtree node
+            aggregates, approximating far away groups of agents by their
+            centre of mass when their size is less than theta times their
+            distance (see QuadTree.aggregate). Switches to the quadtree. A
+            theta of None goes back to exact sums over the neighbours. Not
+            used by the array store flocking kernel. '''
+        if theta is not None:
+            self.use_quadtree()
+        self.far_field = theta
+
+    def separate_pairs(self, agents):
+        ''' Set the separation force of the given 'flocking' agents: a unit
+            push away from each neighbour closer than Agent.SEPARATE_DIST,
+            with each pair of flocking agents visited once and pushed equal
+            and opposite. (Not the same push as Agent.separate().) '''
+        for agent in agents:
+            agent.separation.set(0.0, 0.0)
+            agent.find_flock_neighbours()
+        for agent in agents:
+            radius = min(agent.neighbour_radius, agent.SEPARATE_DIST)
+            x, y = agent.pos.x, agent.pos.y
+            ident = agent.id
+            push = agent.separation
+            for other in agent.neighbours:
+                both = other.mode == 'flocking'
+                # pairs of flocking agents once, from the lower id
+                if both and other.id <= ident:
+                    continue
+                dx = other.pos.x - x
+                dy = other.pos.y - y
+                dist_sq = dx*dx + dy*dy
+                limit = min(radius, other.neighbour_radius)
+                if dist_sq >= limit * limit or dist_sq == 0.0:
+                    continue
+                dist = sqrt(dist_sq)
+                dx /= dist
+                dy /= dist
+                # away from the other agent, and the other agent away from us
+                push.x -= dx
+                push.y -= dy
+                if both:
+                    opposite = other.separation
+                    opposite.x += dx
+                    opposite.y += dy
+
+    def topological_count(self):
+        ''' Largest neighbour_count of the agents in 'topological' mode (0 if
+            there are none). '''
+        return max([agent.neighbour_count for agent in self.agents
+                    if agent.mode == 'topological'] or [0])
+
+    def lists_needed(self):
+        ''' True if some agent will search the neighbour lists this tick:
+            only 'flocking' agents use them, and not when far field sums are
+            used. The lists stay correct while not updated, as moves are
+            measured from where the agents were at the last build. '''
+        if self.far_field is not None:
+            return False
+        return any(agent.mode == 'flocking' for agent in self.agents)
+
+    def rebuild_grid(self, topological=0):
+        ''' Bucket all agents into the spatial grid. The cell size follows the
+            largest agent neighbour radius so a search only needs the cells
+            next to the agent's own cell. For k nearest searches (topological
+            is the largest k), cells are made small enough to hold about k
+            agents each on average, so a search only visits a few of them. '''
+        agents = self.agents
+        if agents:
+            radius = max(agent.neighbour_radius for agent in agents)
+            if topological:
+                cell = sqrt(self.cx * self.cy * topological / len(agents))
+                radius = max(min(radius, cell), 1.0)
+        else:
+            radius = None
+        self.grid.rebuild(agents, self.cx, self.cy, radius)
 
     def render(self):
-        for agent in self.agents:
-            agent.render()
+        with profiler.phase('render'):
+            self.render_static()
+            # draw the shapes as a few batched GL calls
+            egi.begin_batch()
+            if self.arrays is not None and self.agents:
+                self.render_agent_shapes()
+                for agent in self.agents:
+                    agent.render_details()
+            else:
+                for agent in self.agents:
+                    agent.render()
+            egi.end_batch()
+
+            if self.show_info:
+                egi.white_pen()
+                egi.text_at_pos(0, 0, self.mode_summary())
+                if self.neighbour_lists is not None:
+                    egi.text_at_pos(0, 30, 'neighbour lists rebuilt %.1f%%' %
+                                    (100.0 * self.neighbour_lists.rebuild_rate()))
+                if self.pairs_separated:
+                    egi.text_at_pos(0, 45, 'symmetric separation')
+
+    def render_agent_shapes(self):
+        ''' Draw the vehicle shapes of all agents from the array store: the
+            vertices of every agent are transformed at once into one (N,K,2)
+            array, drawn with one closed_shapes() call per agent colour. All
+            agents share the vehicle shape of the first. '''
+        agents = self.agents
+        self.arrays.sync(agents)
+        vertices = self.arrays.shape_vertices(agents[0].vehicle_shape)
+        rows = {}
+        for row, agent in enumerate(agents):
+            rows.setdefault(agent.color, []).append(row)
+        for color, group in rows.items():
+            egi.set_pen_color(name=color)
+            egi.closed_shapes(vertices[group])
+
+    def render_walls(self):
+        egi.blue_pen()
+        egi.closed_shape(self.walls, False)
+
+    def mode_summary(self):
+        ''' Return the info text listing the modes of the agents. Only
+            rebuilt when an agent mode has changed or agents have been added
+            or removed. '''
+        if self.modes_changed or len(self.agents) != self.mode_count:
+            self.mode_text = ', '.join(set(agent.mode for agent in self.agents))
+            self.mode_count = len(self.agents)
+            self.modes_changed = False
+        return self.mode_text
+
+    def add_static(self, name, draw):
+        ''' Add a static geometry layer (walls, obstacles, paths...): draw()
+            draws it using egi. The drawing is recorded once and the recording
+            is drawn each frame, until static_changed() is called. '''
+        self.static_layers[name] = draw
+        self.static_dirty.add(name)
+
+    def static_changed(self, name=None):
+        ''' Record the named layer (or all layers) again on the next render.
+            Call after changing static geometry or resizing the window. '''
+        if name is None:
+            self.static_dirty.update(self.static_layers)
+        else:
+            self.static_dirty.add(name)
 
-        if self.show_info:
-            infotext = ', '.join(set(agent.mode for agent in self.agents))
-            egi.white_pen()
-            egi.text_at_pos(0, 0, infotext)
+    def render_static(self):
+        ''' Draw the static layers, recording those that have changed. '''
+        for name, draw in self.static_layers.items():
+            if name in self.static_dirty:
+                egi.record_static(name, draw)
+            egi.draw_static(name)
+        self.static_dirty.clear()
 
     def wrap_around(self, pos):
         ''' Treat world as a toroidal space. Updates parameter object pos '''
         max_x, max_y = self.cx, self.cy
-        if pos.x > max_x:
-            pos.x = pos.x - max_x
-        elif pos.x < 0:
-            pos.x = max_x - pos.x
-        if pos.y > max_y:
-            pos.y = pos.y - max_y
-        elif pos.y < 0:
-            pos.y = max_y - pos.y
+        # read each value once, and only write back the ones that change
+        x = pos.x
+        if x > max_x:
+            pos.x = x - max_x
+        elif x < 0:
+            pos.x = max_x - x
+        y = pos.y
+        if y > max_y:
+            pos.y = y - max_y
+        elif y < 0:
+            pos.y = max_y - y
 
     def transform_points(self, points, pos, forward, side, scale):
         ''' Transform the given list of points, using the provided position,
             direction and scale, to object world space. '''
         # make a copy of original points (so we don't trash them)
         wld_pts = [pt.copy() for pt in points]
-        # create a transformation matrix to perform the operations
-        mat = Matrix33()
-        # scale,
-        mat.scale_update(scale.x, scale.y)
-        # rotate
-        mat.rotate_by_vectors_update(forward, side)
-        # and translate
-        mat.translate_update(pos.x, pos.y)
+        # create the scale, rotate and translate transformation matrix
+        mat = Matrix33.from_pose(pos, forward, side, scale)
         # now transform all the points (vertices)
         mat.transform_vector2d_list(wld_pts)
         # done
@@ -68,12 +373,8 @@ class World(object):
             direction and scale, to object world space. '''
         # make a copy of original points (so we don't trash them)
         wld_pt = point.copy()
-        # create a transformation matrix to perform the operations
-        mat = Matrix33()
-        # rotate
-        mat.rotate_by_vectors_update(forward, side)
-        # and translate
-        mat.translate_update(pos.x, pos.y)
+        # create the rotate and translate transformation matrix
+        mat = Matrix33.from_pose(pos, forward, side)
         # now transform all the points (vertices)
         mat.transform_vector2d(wld_pt)
         # done
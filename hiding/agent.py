@@ -10,6 +10,8 @@ from graphics import egi, KEY
 from math import sin, cos, radians, sqrt
 from random import random, randrange, uniform
 from path import Path
+from profiler import profiler
+from time import perf_counter
 
 AGENT_MODES = {
 }
@@ -26,6 +28,7 @@ class Agent(object):
     def __init__(self, world=None, scale=30.0, mass=1.0, mode=None, color=None, speed=0.0):
         # keep a reference to the world object
         self.world = world
+        self._mode = None
         self.mode = mode
         # where am i and where am i going? random start pos
         dir = radians(random()*360)
@@ -49,6 +52,9 @@ class Agent(object):
             Point2D( 1.0,  0.0),
             Point2D(-1.0, -0.6)
         ]
+        # world space vehicle_shape, recalculated when shape_dirty is set
+        self.shape_pts = None
+        self.shape_dirty = True
 
         # wander details
         self.wander_target = Vector2D(1, 0)
@@ -63,14 +69,22 @@ class Agent(object):
         # debug draw info?
         self.show_info = False
 
-        # objects for hiding spots
-        self.obstacles = [
-            Vector2D(402,414),
-            Vector2D(150,335),
-            Vector2D(350,116)
-        ]
+        # objects for hiding spots (drawn by the world)
+        self.obstacles = world.obstacles
         self.cur_dest = Vector2D()
 
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        # let the world know, for its mode summary
+        if mode != self._mode:
+            self._mode = mode
+            if self.world is not None:
+                self.world.modes_changed = True
+
     def calculate(self, delta):
         # calculate the current steering force
         mode = self.mode
@@ -90,39 +104,60 @@ class Agent(object):
         ''' update vehicle position and orientation '''
         # calculate and set self.force to be applied
         ## force = self.calculate()
-        force = self.calculate(delta)   #delta needed for wander
+        if profiler.enabled:
+            start = perf_counter()
+            self.calculate(delta)
+            middle = perf_counter()
+            self.integrate(delta)
+            profiler.add('calculate', middle - start)
+            profiler.add('integrate', perf_counter() - middle)
+        else:
+            self.calculate(delta)   #delta needed for wander
+            self.integrate(delta)
+
+    def integrate(self, delta):
+        ''' apply the current force (self.force) to the vehicle velocity,
+            position and orientation '''
+        force = self.force
         # limit force for wander
         force.truncate(self.max_force)
         # determin the new accelteration
-        self.accel = force / self.mass  # not needed if mass = 1.0
-        # new velocity
-        self.vel += self.accel * delta
-        # check for limits of new velocity
-        self.vel.truncate(self.max_speed)
+        accel = self.accel.set_from(force)
+        accel /= self.mass  # not needed if mass = 1.0
+        # new velocity, within its limits
+        vel = self.vel
+        vel.add_scaled(accel, delta)
+        speed = vel.truncate_length(self.max_speed)
         # update position
-        self.pos += self.vel * delta
+        self.pos.add_scaled(vel, delta)
         # update heading is non-zero velocity (moving)
-        if self.vel.length_sq() > 0.00000001:
-            self.heading = self.vel.get_normalised()
-            self.side = self.heading.perp()
+        if speed > 0.0001:
+            vel.normalise_into(self.heading)
+            self.heading.perp_into(self.side)
         # treat world as continuous space - wrap new position if needed
         self.world.wrap_around(self.pos)
+        if speed > 0.:
+            # moved, so the world space shape needs recalculating
+            self.shape_dirty = True
+
+    def shape_points(self):
+        ''' Return vehicle_shape in world space. The points are cached and
+            only recalculated after the pose has changed (shape_dirty). '''
+        if self.shape_dirty:
+            self.shape_pts = self.world.transform_points(
+                self.vehicle_shape, self.pos, self.heading, self.side,
+                self.scale)
+            self.shape_dirty = False
+        return self.shape_pts
 
     def render(self, color=None):
         ''' Draw the triangle agent with color'''
         # draw the ship
         egi.set_pen_color(name=self.color)
-        pts = self.world.transform_points(self.vehicle_shape, self.pos,
-                                          self.heading, self.side, self.scale)
+        pts = self.shape_points()
         # draw it!
         egi.closed_shape(pts)
 
-        #draw hiding spots
-        egi.blue_pen()
-        egi.circle(self.obstacles[0], 25)
-        egi.circle(self.obstacles[1], 50)
-        egi.circle(self.obstacles[2], 75)
-
         #draw detection box
         egi.blue_pen()
         length = 1.0 * (self.speed() / self.max_speed) * 3.0            #db length
@@ -143,8 +178,10 @@ class Agent(object):
 
     def seek(self, target_pos):
         ''' move towards target position '''
-        desired_vel = (target_pos - self.pos).normalise() * self.max_speed
-        return (desired_vel - self.vel)
+        force = Vector2D().set_diff(target_pos, self.pos).normalise()
+        force *= self.max_speed  # desired velocity
+        force -= self.vel
+        return force
 
     def flee(self, hunter_pos):
         ''' move away from hunter position '''
@@ -158,7 +195,7 @@ class Agent(object):
         ''' this behaviour is similar to seek() but it attempts to arrive at
             the target position with a zero velocity'''
         decel_rate = self.DECELERATION_SPEEDS[speed]
-        to_target = target_pos - self.pos
+        to_target = Vector2D().set_diff(target_pos, self.pos)
         dist = to_target.length()
         if dist > 0:
             # calculate the speed required to reach the target given the
@@ -168,10 +205,12 @@ class Agent(object):
             speed = min(speed, self.max_speed)
             # from here proceed just like Seek except we don't need to
             # normalize the to_target vector because we have already gone to the
-            # trouble of calculating its length for dist.
-            desired_vel = to_target * (speed / dist)
-            return (desired_vel - self.vel)
-        return Vector2D(0, 0)
+            # trouble of calculating its length for dist. to_target becomes
+            # the desired velocity, then the steering force.
+            to_target *= speed / dist
+            to_target -= self.vel
+            return to_target
+        return to_target.set(0., 0.)
 
     def wander(self, delta):
         ''' random wandering using a projected jitter circle '''
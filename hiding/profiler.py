@@ -0,0 +1,133 @@
+'''Per-phase frame profiler
+
+Measures how long each phase of a frame takes (world update, agent calculate,
+neighbour search, integrate, render...) and keeps the totals of the last
+frames of each phase in a ring buffer, to report mean, p95 and p99 times.
+This module creates a "profiler" object for anyone to use.
+
+Profiling is off by default. Instrumented code checks profiler.enabled (or
+uses profiler.phase(), which returns a do-nothing context when disabled), so
+it costs close to nothing when off. Results can be drawn as an overlay with
+render(), or fetched with stats() / dump() as plain data and JSON.
+
+'''
+
+import json
+from collections import deque
+from math import ceil
+from time import perf_counter
+
+from graphics import egi
+
+
+class _Phase(object):
+    ''' Context manager that adds its elapsed time to a profiler phase. '''
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, perf_counter() - self.start)
+
+
+class _NullPhase(object):
+    ''' Context manager used while the profiler is disabled. '''
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL_PHASE = _NullPhase()
+
+
+def _percentile(ordered, p):
+    ''' nearest rank percentile (p from 0.0 to 1.0) of a sorted list '''
+    return ordered[max(int(ceil(p * len(ordered))) - 1, 0)]
+
+
+class Profiler(object):
+
+    def __init__(self, frames=300):
+        self.enabled = False
+        self.reset(frames)
+
+    def reset(self, frames=None):
+        ''' Forget all timings. frames sets the ring buffer length. '''
+        if frames is not None:
+            self.frames = frames
+        self.history = {}  # phase name -> deque of per frame seconds
+        self.current = {}  # phase name -> seconds so far this frame
+        self.last_frame = perf_counter()
+
+    def toggle(self):
+        ''' Switch profiling on (with fresh timings) or off. '''
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.reset()
+
+    def phase(self, name):
+        ''' Context manager that times the enclosed code as phase name. '''
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        ''' Add time to a phase of the current frame. '''
+        current = self.current
+        current[name] = current.get(name, 0.0) + seconds
+
+    def end_frame(self):
+        ''' Store the phase totals of the current frame (and the time since
+            the previous end_frame as the "frame" phase). Call once per
+            rendered frame or headless tick. '''
+        if not self.enabled:
+            return
+        now = perf_counter()
+        self.current['frame'] = now - self.last_frame
+        self.last_frame = now
+        for name, seconds in self.current.items():
+            times = self.history.get(name)
+            if times is None:
+                times = self.history[name] = deque(maxlen=self.frames)
+            times.append(seconds)
+        self.current = {}
+
+    def stats(self):
+        ''' Return {phase: {'frames', 'mean', 'p95', 'p99', 'max'}} with the
+            times in milliseconds. '''
+        result = {}
+        for name, times in self.history.items():
+            ordered = sorted(times)
+            result[name] = {
+                'frames': len(ordered),
+                'mean': 1000.0 * sum(ordered) / len(ordered),
+                'p95': 1000.0 * _percentile(ordered, 0.95),
+                'p99': 1000.0 * _percentile(ordered, 0.99),
+                'max': 1000.0 * ordered[-1],
+            }
+        return result
+
+    def dump(self, path):
+        ''' Save stats() as JSON. '''
+        with open(path, 'w') as f:
+            json.dump(self.stats(), f, indent=2, sort_keys=True)
+
+    def render(self):
+        ''' Draw a table of the phase timings at the top left of the window. '''
+        lines = ['%-10s %7s %7s %7s' % ('ms', 'mean', 'p95', 'p99')]
+        for name, s in sorted(self.stats().items()):
+            lines.append('%-10s %7.2f %7.2f %7.2f' % (
+                name, s['mean'], s['p95'], s['p99']))
+        egi.white_pen()
+        for i, line in enumerate(lines):
+            egi.text_at_pos(0, -15 * (i + 1), line)
+
+
+# create an instance for anyone to use
+profiler = Profiler()
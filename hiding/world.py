@@ -7,6 +7,7 @@ Created for COS30002 AI for Games by Clinton Woodward cwoodward@swin.edu.au
 from vector2d import Vector2D
 from matrix33 import Matrix33
 from graphics import egi
+from profiler import profiler
 
 
 class World(object):
@@ -18,50 +19,104 @@ class World(object):
         self.agents = []
         self.paused = True
         self.show_info = True
+        # agent modes info text (see mode_summary)
+        self.modes_changed = True
+        self.mode_text = ''
+        self.mode_count = 0
+        # static geometry layers, drawn from a recording (see add_static)
+        self.static_layers = {}
+        self.static_dirty = set()
+        # objects for hiding spots, shared by all agents, and their sizes
+        self.obstacles = [
+            Vector2D(402,414),
+            Vector2D(150,335),
+            Vector2D(350,116)
+        ]
+        self.obstacle_radii = [25, 50, 75]
+        self.add_static('obstacles', self.render_obstacles)
 
     def update(self, delta):
         if not self.paused:
-            for agent in self.agents:
-                agent.update(delta)
+            with profiler.phase('update'):
+                for agent in self.agents:
+                    agent.update(delta)
 
     def render(self):
-        for agent in self.agents:
-            agent.render()
+        with profiler.phase('render'):
+            self.render_static()
+            # draw the shapes as a few batched GL calls
+            egi.begin_batch()
+            for agent in self.agents:
+                agent.render()
+
+            for target in self.targets:
+                egi.red_pen()
+                egi.cross(target, 10)
+            egi.end_batch()
+
+            if self.show_info:
+                egi.white_pen()
+                egi.text_at_pos(0, 0, self.mode_summary())
+
+    def render_obstacles(self):
+        egi.blue_pen()
+        egi.circles(self.obstacles, self.obstacle_radii)
+
+    def mode_summary(self):
+        ''' Return the info text listing the modes of the agents. Only
+            rebuilt when an agent mode has changed or agents have been added
+            or removed. '''
+        if self.modes_changed or len(self.agents) != self.mode_count:
+            self.mode_text = ', '.join(set(agent.mode for agent in self.agents))
+            self.mode_count = len(self.agents)
+            self.modes_changed = False
+        return self.mode_text
+
+    def add_static(self, name, draw):
+        ''' Add a static geometry layer (walls, obstacles, paths...): draw()
+            draws it using egi. The drawing is recorded once and the recording
+            is drawn each frame, until static_changed() is called. '''
+        self.static_layers[name] = draw
+        self.static_dirty.add(name)
 
-        for target in self.targets:
-            egi.red_pen()
-            egi.cross(target, 10)
+    def static_changed(self, name=None):
+        ''' Record the named layer (or all layers) again on the next render.
+            Call after changing static geometry or resizing the window. '''
+        if name is None:
+            self.static_dirty.update(self.static_layers)
+        else:
+            self.static_dirty.add(name)
 
-        if self.show_info:
-            infotext = ', '.join(set(agent.mode for agent in self.agents))
-            egi.white_pen()
-            egi.text_at_pos(0, 0, infotext)
+    def render_static(self):
+        ''' Draw the static layers, recording those that have changed. '''
+        for name, draw in self.static_layers.items():
+            if name in self.static_dirty:
+                egi.record_static(name, draw)
+            egi.draw_static(name)
+        self.static_dirty.clear()
 
     def wrap_around(self, pos):
         ''' Treat world as a toroidal space. Updates parameter object pos '''
         max_x, max_y = self.cx, self.cy
-        if pos.x > max_x:
-            pos.x = pos.x - max_x
-        elif pos.x < 0:
-            pos.x = max_x - pos.x
-        if pos.y > max_y:
-            pos.y = pos.y - max_y
-        elif pos.y < 0:
-            pos.y = max_y - pos.y
+        # read each value once, and only write back the ones that change
+        x = pos.x
+        if x > max_x:
+            pos.x = x - max_x
+        elif x < 0:
+            pos.x = max_x - x
+        y = pos.y
+        if y > max_y:
+            pos.y = y - max_y
+        elif y < 0:
+            pos.y = max_y - y
 
     def transform_points(self, points, pos, forward, side, scale):
         ''' Transform the given list of points, using the provided position,
             direction and scale, to object world space. '''
         # make a copy of original points (so we don't trash them)
         wld_pts = [pt.copy() for pt in points]
-        # create a transformation matrix to perform the operations
-        mat = Matrix33()
-        # scale,
-        mat.scale_update(scale.x, scale.y)
-        # rotate
-        mat.rotate_by_vectors_update(forward, side)
-        # and translate
-        mat.translate_update(pos.x, pos.y)
+        # create the scale, rotate and translate transformation matrix
+        mat = Matrix33.from_pose(pos, forward, side, scale)
         # now transform all the points (vertices)
         mat.transform_vector2d_list(wld_pts)
         # done
@@ -72,12 +127,8 @@ class World(object):
             direction and scale, to object world space. '''
         # make a copy of original points (so we don't trash them)
         wld_pt = point.copy()
-        # create a transformation matrix to perform the operations
-        mat = Matrix33()
-        # rotate
-        mat.rotate_by_vectors_update(forward, side)
-        # and translate
-        mat.translate_update(pos.x, pos.y)
+        # create the rotate and translate transformation matrix
+        mat = Matrix33.from_pose(pos, forward, side)
         # now transform all the points (vertices)
         mat.transform_vector2d(wld_pt)
         # done
@@ -10,6 +10,8 @@ from graphics import egi, KEY
 from math import sin, cos, tan, radians, sqrt, degrees
 from random import random, randrange, uniform, randint
 from path import Path
+from profiler import profiler
+from time import perf_counter
 
 AGENT_MODES = {
     KEY._1: 'rifle',
@@ -30,6 +32,7 @@ class Agent(object):
     def __init__(self, world=None, scale=30.0, mass=1.0, mode=None, color=None, speed=0.0):
         # keep a reference to the world object
         self.world = world
+        self._mode = None
         self.mode = mode
         # where am i and where am i going
         self.angle = 0
@@ -54,6 +57,9 @@ class Agent(object):
             Point2D( 1.0,  0.0),
             Point2D(-1.0, -0.6)
         ]
+        # world space vehicle_shape, recalculated when shape_dirty is set
+        self.shape_pts = None
+        self.shape_dirty = True
 
         self.margin = Vector2D(self.world.cx - 10, self.world.cy - 10)
 
@@ -64,7 +70,7 @@ class Agent(object):
         self.y1 = 450   #y bottom pt
         self.target_dir = 'right'
         self.target_mid = Vector2D((self.x1-self.x0) / 2, (self.y0-self.y1) / 2)
-        self.target_pos = None      #provided at each new render
+        self.target_pos = Vector2D(self.x0 + self.target_mid.x, self.y1 + self.target_mid.y)      #updated as the target moves
 
         # data for drawing bullet
         self.steps = None       #frequency of shots hitting target
@@ -73,6 +79,18 @@ class Agent(object):
         self.avg = Vector2D()
         self.size = None
 
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        # let the world know, for its mode summary
+        if mode != self._mode:
+            self._mode = mode
+            if self.world is not None:
+                self.world.modes_changed = True
+
     def calculate(self, delta):
         # calculate the current steering force
         mode = self.mode
@@ -95,29 +113,59 @@ class Agent(object):
         ''' update vehicle position and orientation '''
         # calculate and set self.force to be applied
         ## force = self.calculate()
-        force = self.calculate(delta)   #delta needed for wander
+        if profiler.enabled:
+            start = perf_counter()
+            self.calculate(delta)
+            middle = perf_counter()
+            self.integrate(delta)
+            profiler.add('calculate', middle - start)
+            profiler.add('integrate', perf_counter() - middle)
+        else:
+            self.calculate(delta)   #delta needed for wander
+            self.integrate(delta)
+        # move the target and any bullet on
+        self.movingTarget()
+        self.target_pos = Vector2D(self.x0 + self.target_mid.x, self.y1 + self.target_mid.y)
+        self.bulletStep()
+
+    def integrate(self, delta):
+        ''' apply the current force (self.force) to the vehicle velocity,
+            position and orientation '''
+        force = self.force
         # limit force for wander
         force.truncate(self.max_force)
         # determin the new accelteration
-        self.accel = force / self.mass  # not needed if mass = 1.0
-        # new velocity
-        self.vel += self.accel * delta
-        # check for limits of new velocity
-        self.vel.truncate(self.max_speed)
+        accel = self.accel.set_from(force)
+        accel /= self.mass  # not needed if mass = 1.0
+        # new velocity, within its limits
+        vel = self.vel
+        vel.add_scaled(accel, delta)
+        speed = vel.truncate_length(self.max_speed)
         # update position
-        self.pos += self.vel * delta
+        self.pos.add_scaled(vel, delta)
         # update heading is non-zero velocity (moving)
-        if self.vel.length_sq() > 0.00000001:
-            self.heading = self.vel.get_normalised()
-            self.side = self.heading.perp()
+        if speed > 0.0001:
+            vel.normalise_into(self.heading)
+            self.heading.perp_into(self.side)
         # treat world as continuous space - wrap new position if needed
         self.world.wrap_around(self.pos)
+        if speed > 0.:
+            # moved, so the world space shape needs recalculating
+            self.shape_dirty = True
+
+    def shape_points(self):
+        ''' Return vehicle_shape in world space. The points are cached and
+            only recalculated after the pose has changed (shape_dirty). '''
+        if self.shape_dirty:
+            self.shape_pts = self.world.transform_points(
+                self.vehicle_shape, self.pos, self.heading, self.side,
+                self.scale)
+            self.shape_dirty = False
+        return self.shape_pts
 
     def render(self, color=None):
         ''' Draw moving target '''
-        #calculate target points
-        self.movingTarget()
-        #draw target using those points
+        #draw target using its current points
         egi.blue_pen()
         dbox = [
             Point2D(self.x0, self.y0),
@@ -126,31 +174,18 @@ class Agent(object):
             Point2D(self.x0, self.y1)
         ]
         egi.closed_shape(dbox, False)
-        #pos of target
-        self.target_pos = Vector2D(self.x0 + self.target_mid.x, self.y1 + self.target_mid.y)
 
         ''' Draw the triangle agent with color'''
         # draw the ship
         egi.set_pen_color(name=self.color)
-        pts = self.world.transform_points(self.vehicle_shape, self.pos,
-                                          self.heading, self.side, self.scale)
+        pts = self.shape_points()
         # draw it!
         egi.closed_shape(pts)
 
         #draw bullets being fired
         egi.green_pen()
         if self.mode == 'rifle' or self.mode == 'rocket' or self.mode == 'handgun' or self.mode == 'grenade':
-            if self.step_count == 0:
-                egi.circle(self.bullet_pos, self.size)
-                self.step_count += 1
-            elif self.bullet_pos.y > self.target_pos.y:
-                self.step_count = 0
-                self.bullet_pos = Vector2D(250,250)
-                self.mode = 'aim'
-            else:
-                self.bullet_pos += self.avg
-                egi.circle(self.bullet_pos, self.size)
-                self.step_count += 1
+            egi.circle(self.bullet_pos, self.size)
 
     def speed(self):
         return self.vel.length()
@@ -201,6 +236,19 @@ class Agent(object):
         self.bulletTrajectory(Vector2D(0,0))
         return Vector2D()
 
+    def bulletStep(self):
+        #move a fired bullet on, until it passes the target
+        if self.mode == 'rifle' or self.mode == 'rocket' or self.mode == 'handgun' or self.mode == 'grenade':
+            if self.step_count == 0:
+                self.step_count += 1
+            elif self.bullet_pos.y > self.target_pos.y:
+                self.step_count = 0
+                self.bullet_pos = Vector2D(250,250)
+                self.mode = 'aim'
+            else:
+                self.bullet_pos += self.avg
+                self.step_count += 1
+
     def bulletTrajectory(self, offset):
         #diff = self.target_pos - self.pos
         if self.target_dir == 'right':
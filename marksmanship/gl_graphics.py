@@ -0,0 +1,447 @@
+'''OpenGL drawing backend for the egi object, using pyglet
+
+Created for COS30002 AI for Games by Clinton Woodward cwoodward@swin.edu.au
+
+This is the real implementation of the EasyGraphics interface. It is only
+imported (along with pyglet.gl) when egi.InitWithPyglet() is called; see the
+graphics module.
+
+Note: This has not been designed for performance! In particular, excessive
+text drawing will be very expensive. If you need better performance, you
+should implement opengl code for yourself.
+
+For many agents, wrap the drawing in begin_batch() and end_batch(). Lines,
+shapes, circles and dots are then collected into vertex buffers grouped by
+pen colour and stroke, and drawn with a few glDrawArrays calls per group at
+end_batch(), instead of a few GL calls for every shape. (Within a batch,
+filled shapes are drawn first, then lines, then dots, so the drawing order
+of overlapping shapes of different colours can change.)
+
+'''
+from pyglet.gl import *
+from pyglet import font
+from graphics import COLOR_NAMES
+from math import cos, sin, pi
+from collections import OrderedDict
+
+# circle levels of detail: (largest radius, number of slices), used when
+# circle() is not given the number of slices
+CIRCLE_LODS = ((3, 8), (12, 16), (48, 32))
+CIRCLE_MAX_SLICES = 64
+# number of text labels to keep laid out (see text_at_pos)
+MAX_LABELS = 256
+_circle_segments = {}  # slices -> unit circle segments
+
+
+def circle_segments(slices):
+    ''' Return the edges of a unit circle of slices segments, as a list of
+        (x0, y0, x1, y1) tuples. Calculated once for each number of slices. '''
+    segs = _circle_segments.get(slices)
+    if segs is None:
+        pts = [(cos(2*pi*i/slices), sin(2*pi*i/slices)) for i in range(slices)]
+        segs = [p0 + p1 for p0, p1 in zip(pts, pts[1:] + pts[:1])]
+        _circle_segments[slices] = segs
+    return segs
+
+
+def circle_slices(radius):
+    ''' the number of slices to draw a circle of radius with '''
+    for max_radius, slices in CIRCLE_LODS:
+        if radius <= max_radius:
+            return slices
+    return CIRCLE_MAX_SLICES
+
+
+def _fill_buffer(buf, values):
+    ''' Copy values into the GLfloat array buf, replacing it with a bigger
+        one if needed. Returns the buffer to keep for next time. '''
+    n = len(values)
+    if len(buf) < n:
+        buf = (GLfloat * max(n, 2 * len(buf)))()
+    buf[:n] = values
+    return buf
+
+
+class _Batch(object):
+    ''' Vertices of one pen colour and stroke, collected between
+        begin_batch() and end_batch(). The GLfloat buffers are kept and
+        reused every frame. '''
+
+    def __init__(self):
+        self.tris = []    # x, y values, 3 vertices per filled triangle
+        self.lines = []   # x, y values, 2 vertices per line segment
+        self.points = []  # x, y values of dots
+        self.buffers = [(GLfloat * 0)(), (GLfloat * 0)(), (GLfloat * 0)()]
+
+    def draw(self):
+        for i, (values, mode) in enumerate(((self.tris, GL_TRIANGLES),
+                                            (self.lines, GL_LINES),
+                                            (self.points, GL_POINTS))):
+            if values:
+                buf = self.buffers[i] = _fill_buffer(self.buffers[i], values)
+                glVertexPointer(2, GL_FLOAT, 0, buf)
+                glDrawArrays(mode, 0, len(values) // 2)
+                del values[:]
+
+
+class EasyGraphics(object):
+
+    def __init__(self):
+        # current "pen" colour of lines
+        self.pen_color = (1, 0, 0, 1.)
+        self.stroke = 1.0  # - thickness the default
+        # batched drawing (see begin_batch)
+        self.batching = False
+        self.batches = {}  # (colour, stroke) -> _Batch
+        # recorded static layers (see record_static)
+        self.static_lists = {}  # layer name -> GL display list id
+
+    def InitWithPyglet(self, window):
+        # stuff that needs to be done *after* the pyglet window is created
+        self.set_pen_color(self.pen_color)
+        self.set_stroke(self.stroke)
+        self.window = window
+        # prep the text object
+        self.font = font.load('', 10)
+        self.text = font.Text(self.font, '', color=(1, 1, 1, 1),
+                              valign='bottom', halign='left')
+        # laid out text labels, (text, x, y, colour) -> font.Text
+        self.labels = OrderedDict()
+
+    # ----- BATCHED DRAWING -----
+    def begin_batch(self):
+        ''' Collect the following drawing calls (except text) instead of
+            drawing them straight away, until end_batch(). '''
+        self.batching = True
+
+    def end_batch(self):
+        ''' Draw everything collected since begin_batch(), one colour and
+            stroke group at a time. '''
+        self.batching = False
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        for (color, stroke), batch in self.batches.items():
+            if not (batch.tris or batch.lines or batch.points):
+                continue
+            glColor4f(*color)
+            glLineWidth(stroke)
+            batch.draw()
+        glPopClientAttrib()
+        # back to the current pen
+        glColor4f(*self.curr_color)
+        glLineWidth(self.stroke)
+
+    def _batch(self, color=None):
+        ''' the _Batch of the current (or given) colour and stroke '''
+        key = (tuple(color or self.curr_color), self.stroke)
+        batch = self.batches.get(key)
+        if batch is None:
+            batch = self.batches[key] = _Batch()
+        return batch
+
+    def closed_shapes(self, shapes, filled=False):
+        ''' Draw many closed shapes of K points at once, from an (N,K,2)
+            NumPy array of vertices (see agent_arrays.transform_shapes).
+            Uses the current pen, and is batched like closed_shape(). '''
+        import numpy as np
+        n, k = shapes.shape[:2]
+        if n == 0 or k < 2:
+            return
+        if filled:
+            # triangle fan of each shape: point 0, point i, point i+1
+            fan = np.stack((np.repeat(shapes[:, :1], k - 2, axis=1),
+                            shapes[:, 1:-1], shapes[:, 2:]), axis=2)
+            values = fan.ravel().tolist()
+            mode = GL_TRIANGLES
+        else:
+            # line segments from each point to the next (and back to 0)
+            segs = np.stack((shapes, np.roll(shapes, -1, axis=1)), axis=2)
+            values = segs.ravel().tolist()
+            mode = GL_LINES
+        if self.batching:
+            batch = self._batch()
+            (batch.tris if filled else batch.lines).extend(values)
+            return
+        buf = (GLfloat * len(values))(*values)
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, buf)
+        glDrawArrays(mode, 0, len(values) // 2)
+        glPopClientAttrib()
+
+    # ----- STATIC LAYERS -----
+    def record_static(self, name, draw):
+        ''' Record the (batched) drawing done by calling draw() as the static
+            layer name, replacing any previous recording of that name. Only
+            the recording is drawn, by draw_static(). '''
+        list_id = self.static_lists.get(name)
+        if list_id is None:
+            list_id = self.static_lists[name] = glGenLists(1)
+        # the layer pens are compiled into the list, keep the current pen
+        color = self.curr_color
+        glNewList(list_id, GL_COMPILE)
+        self.begin_batch()
+        draw()
+        self.end_batch()
+        glEndList()
+        self.curr_color = color
+
+    def draw_static(self, name):
+        ''' Draw a recorded static layer with a single call. '''
+        list_id = self.static_lists.get(name)
+        if list_id is not None:
+            glCallList(list_id)
+            # the GL colour is now the last pen of the layer
+            glColor4f(*self.curr_color)
+
+    # ----- SHAPES -----
+    def dot(self, x=0, y=0, pos=None, color=None):
+        ''' Draw a single pixel at a given location. will use pos (with x and y
+            values) if provided. Colour is (R,G,B,A) values 0.0 to 1.0 '''
+        if pos is not None:
+            x, y = pos.x, pos.y
+        if self.batching:
+            self._batch(color).points.extend((x, y))
+            return
+        if color is not None:
+            glColor4f(*color)
+        glBegin(GL_POINTS)  # draw points (only one!)
+        glVertex3f(x, y, 0.0)
+        glEnd()
+
+    def line(self, x1=0, y1=0, x2=0, y2=0, pos1=None, pos2=None):
+        ''' Draw a single line. Either with xy values, or two position (that
+            contain x and y values). Uses existing colour and stroke values. '''
+        if pos1 is not None and pos2 is not None:
+            x1, y1, x2, y2 = pos1.x, pos1.y, pos2.x, pos2.y
+        if self.batching:
+            self._batch().lines.extend((x1, y1, x2, y2))
+            return
+        glBegin(GL_LINES)
+        glVertex2f(x1, y1)
+        glVertex2f(x2, y2)
+        glEnd()
+
+    def line_by_pos(self, pos1, pos2):
+        ''' Draw a single line. Either with xy values, or two position (that
+            contain x and y values). Uses existing colour and stroke values. '''
+        x1, y1, x2, y2 = pos1.x, pos1.y, pos2.x, pos2.y
+        if self.batching:
+            self._batch().lines.extend((x1, y1, x2, y2))
+            return
+        glBegin(GL_LINES)
+        glVertex2f(x1, y1)
+        glVertex2f(x2, y2)
+        glEnd()
+
+    def polyline(self, points):
+        if len(points) < 2: return
+        if self.batching:
+            lines = self._batch().lines
+            for p1, p2 in zip(points, points[1:]):
+                lines.extend((p1.x, p1.y, p2.x, p2.y))
+            return
+        pts = [(p.x, p.y) for p in points]  # convert to list of tuples
+        pts = ((GLfloat * 2)*len(pts))(*pts)  # convert to GLfloat list
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, pts)
+        glDrawArrays(GL_LINE_STRIP, 0, len(pts))
+        glPopClientAttrib()
+
+    def line_with_arrow(self, v1, v2, size):
+        norm = v2-v1
+        norm.normalise()
+        # calculate where arrow is attached
+        xpoint = v2 - (norm * size)
+        # calculate the two extra points required to make the arrowhead
+        ap1 = xpoint + (norm.perp() * 0.4 * size)
+        ap2 = xpoint - (norm.perp() * 0.4 * size)
+        # draw line from start to head crossing point
+        if self.batching:
+            self._batch().lines.extend((v1.x, v1.y, xpoint.x, xpoint.y))
+        else:
+            glBegin(GL_LINES)
+            glVertex2f(v1.x, v1.y)
+            glVertex2f(xpoint.x, xpoint.y)
+            glEnd()
+        # draw triangle for head
+        self.closed_shape((v2, ap1, ap2), filled=False)
+
+    def cross(self, pos, diameter):
+        d = diameter
+        x, y = pos.x, pos.y
+        if self.batching:
+            self._batch().lines.extend((x-d, y-d, x+d, y+d,
+                                        x+d, y-d, x-d, y+d))
+            return
+        glBegin(GL_LINES)
+        # TL to BR
+        glVertex2f(x-d, y-d)
+        glVertex2f(x+d, y+d)
+        # TR to BL
+        glVertex2f(x+d, y-d)
+        glVertex2f(x-d, y+d)
+        glEnd()
+
+    def rect(self, left, top, right, bottom, filled=False):
+        if self.batching:
+            if filled:
+                self._batch().tris.extend((left, top, right, top,
+                                           right, bottom, left, top,
+                                           right, bottom, left, bottom))
+            else:
+                self._batch().lines.extend((left, top, right, top,
+                                            right, top, right, bottom,
+                                            right, bottom, left, bottom,
+                                            left, bottom, left, top))
+            return
+        if filled:
+            glBegin(GL_QUADS)
+        else:
+            glBegin(GL_LINE_LOOP)
+        # A single quad - TL to TR to BR to BL (to TL...)
+        glVertex2f(left, top)
+        glVertex2f(right, top)
+        glVertex2f(right, bottom)
+        glVertex2f(left, bottom)
+        glEnd()
+
+    def closed_shape(self, points, filled=False):
+        if len(points) < 2: return
+        if self.batching:
+            batch = self._batch()
+            if filled:
+                # convex shapes only (like GL_POLYGON), as a triangle fan
+                p0 = points[0]
+                for p1, p2 in zip(points[1:], points[2:]):
+                    batch.tris.extend((p0.x, p0.y, p1.x, p1.y, p2.x, p2.y))
+            else:
+                lines = batch.lines
+                prev = points[-1]
+                for p in points:
+                    lines.extend((prev.x, prev.y, p.x, p.y))
+                    prev = p
+            return
+        gl_array_type = GL_POLYGON if filled else GL_LINE_LOOP
+        # convert points to a list of types, then GLfloat list
+        pts = [(p.x, p.y) for p in points]
+        pts = ((GLfloat * 2)*len(pts))(*pts)
+        # tell GL system about the array of points
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(2, GL_FLOAT, 0, pts)
+        # draw array of points, and clean up
+        glDrawArrays(gl_array_type, 0, len(pts))
+        glPopClientAttrib()
+
+    def circle(self, pos, radius, filled=False, slices=0):
+        ''' Draw a circle outline (or filled disc). slices is the number of
+            edges, or 0 to choose from the radius (see CIRCLE_LODS). '''
+        batching = self.batching
+        if not batching:
+            self.begin_batch()
+        self._add_circle(pos.x, pos.y, radius, filled, slices)
+        if not batching:
+            self.end_batch()
+
+    def circles(self, centres, radii, filled=False, slices=0):
+        ''' Draw many circles at once. centres is a list of points or an
+            (N,2) NumPy array, and radii a single radius or one per centre.
+            Batched like circle(), and drawn in one call per colour. '''
+        batching = self.batching
+        if not batching:
+            self.begin_batch()
+        if hasattr(centres, 'shape'):
+            self._add_circle_array(centres, radii, filled, slices)
+        else:
+            if not hasattr(radii, '__len__'):
+                radii = [radii] * len(centres)
+            for pos, radius in zip(centres, radii):
+                self._add_circle(pos.x, pos.y, radius, filled, slices)
+        if not batching:
+            self.end_batch()
+
+    def _add_circle(self, x, y, radius, filled, slices):
+        segs = circle_segments(slices or circle_slices(radius))
+        batch = self._batch()
+        if filled:
+            # a triangle from the centre to each edge
+            tris = batch.tris
+            for x0, y0, x1, y1 in segs:
+                tris.extend((x, y, x + radius*x0, y + radius*y0,
+                             x + radius*x1, y + radius*y1))
+        else:
+            lines = batch.lines
+            for x0, y0, x1, y1 in segs:
+                lines.extend((x + radius*x0, y + radius*y0,
+                              x + radius*x1, y + radius*y1))
+
+    def _add_circle_array(self, centres, radii, filled, slices):
+        import numpy as np
+        n = len(centres)
+        if n == 0:
+            return
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), (n,))
+        segs = np.array(circle_segments(slices or circle_slices(radii.max())))
+        # (N,S,2) start and end points of the S edges of each circle
+        centres = np.asarray(centres, dtype=float)[:, None, :]
+        p0 = centres + radii[:, None, None] * segs[None, :, 0:2]
+        p1 = centres + radii[:, None, None] * segs[None, :, 2:4]
+        batch = self._batch()
+        if filled:
+            tris = np.concatenate((np.broadcast_to(centres, p0.shape), p0, p1),
+                                  axis=2)
+            batch.tris.extend(tris.ravel().tolist())
+        else:
+            lines = np.concatenate((p0, p1), axis=2)
+            batch.lines.extend(lines.ravel().tolist())
+
+    # ----- COLOUR/STROKE STUFF -----
+    def set_pen_color(self, color=None, name=None):
+        if name is not None:
+            color = COLOR_NAMES[name]
+        self.curr_color = color
+        if not self.batching:
+            glColor4f(*self.curr_color)
+
+    def red_pen(self):    self.set_pen_color(name='RED')
+    def blue_pen(self):   self.set_pen_color(name='BLUE')
+    def green_pen(self):  self.set_pen_color(name='GREEN')
+    def black_pen(self):  self.set_pen_color(name='BLACK')
+    def white_pen(self):  self.set_pen_color(name='WHITE')
+    def grey_pen(self):   self.set_pen_color(name='GREY')
+    def aqua_pen(self):   self.set_pen_color(name='AQUA')
+    def orange_pen(self): self.set_pen_color(name='ORANGE')
+
+    def set_stroke(self, stroke):
+        self.stroke = stroke
+        if not self.batching:
+            glLineWidth(self.stroke)
+
+    # ----- TEXT METHODS -----
+    def text_color(self, color=None, name=None):
+        ''' Colour is a tuple (R,G,B,A) with values from 0.0 to 1.0 '''
+        if name is not None:
+            color = COLOR_NAMES[name]
+        self.text.color = color  #
+
+    def text_at_pos(self, x, y, text):
+        ''' Draw text at x, y (negative y is from the top of the window).
+            Laying out text is expensive, so the last MAX_LABELS texts drawn
+            are kept as labels and redrawn as they are while the same text is
+            drawn at the same place in the same colour. '''
+        y = self.window.height + y if y < 0 else y
+        color = tuple(self.text.color)
+        key = (text, x, y, color)
+        labels = self.labels
+        label = labels.get(key)
+        if label is None:
+            label = font.Text(self.font, text, x=x, y=y, color=color,
+                              valign='bottom', halign='left')
+            labels[key] = label
+            if len(labels) > MAX_LABELS:
+                labels.popitem(last=False)  # least recently drawn
+        else:
+            labels.move_to_end(key)
+        label.draw()
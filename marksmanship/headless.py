@@ -0,0 +1,159 @@
+'''Headless simulation runner
+
+Builds a World from a scenario and steps it with a fixed delta, as fast as
+the CPU allows, without pyglet, a window or any OpenGL state (egi is never
+initialised, so it stays on the null graphics backend). Reports the ticks
+per second at the end. For example:
+
+    python headless.py --scenario range --agents 1 --ticks 1000
+
+'''
+
+import json
+import sys
+from argparse import ArgumentParser
+from math import ceil
+from random import seed
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from profiler import profiler
+from world import World
+from agent import Agent
+
+
+# weapons fired in turn by the range scenario (the 1-4 keys in main.py)
+WEAPONS = ('rifle', 'rocket', 'handgun', 'grenade')
+
+
+def shooting_range(world, count):
+    ''' count shooters in the middle of the range (main.py uses 1), each
+        firing one of the WEAPONS '''
+    for i in range(count):
+        agent = Agent(world, 30.0, 1.0, WEAPONS[i % len(WEAPONS)], 'ORANGE',
+                      100.0)
+        agent.shots = i  # index of the weapon fired last
+        world.agents.append(agent)
+
+
+def reload(world):
+    ''' Fire again with the next weapon from every shooter whose last shot
+        has landed (and so is back in 'aim' mode), as if a weapon key was
+        pressed, so the range keeps shooting. '''
+    for agent in world.agents:
+        if agent.mode == 'aim':
+            agent.shots += 1
+            agent.mode = WEAPONS[agent.shots % len(WEAPONS)]
+
+
+SCENARIOS = {
+    'range': shooting_range,
+}
+DEFAULT_SCENARIO = 'range'
+DEFAULT_AGENTS = 1
+
+
+def build(scenario, agents, size=500, rand_seed=None):
+    ''' Create a world of size x size and populate it from a scenario. '''
+    if rand_seed is not None:
+        seed(rand_seed)
+    world = World(size, size)
+    SCENARIOS[scenario](world, agents)
+    world.paused = False
+    return world
+
+
+def run(world, ticks, delta, tick_times=None):
+    ''' Step the world ticks times with a fixed delta, reloading the
+        shooters before each step. Returns the elapsed (wall clock) seconds.
+        If a tick_times list is given, the duration of each tick is appended
+        to it. '''
+    start = perf_counter()
+    if tick_times is None:
+        for _ in range(ticks):
+            reload(world)
+            world.update(delta)
+            profiler.end_frame()
+    else:
+        last = start
+        for _ in range(ticks):
+            reload(world)
+            world.update(delta)
+            profiler.end_frame()
+            now = perf_counter()
+            tick_times.append(now - last)
+            last = now
+    return perf_counter() - start
+
+
+def peak_rss_mb():
+    ''' Peak resident memory of this process in MB (None if unknown). '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0)
+
+
+def report(scenario, world, ticks, elapsed, tick_times):
+    ''' Summary of a run as a dict (times in ms). '''
+    ordered = sorted(tick_times)
+    def percentile(p):
+        return 1000.0 * ordered[max(int(ceil(p * len(ordered))) - 1, 0)]
+    return {
+        'scenario': scenario,
+        'agents': len(world.agents),
+        'ticks': ticks,
+        'elapsed': elapsed,
+        'ticks_per_sec': ticks / elapsed if elapsed > 0 else None,
+        'p50_ms': percentile(0.50) if ordered else None,
+        'p95_ms': percentile(0.95) if ordered else None,
+        'p99_ms': percentile(0.99) if ordered else None,
+        'max_ms': 1000.0 * ordered[-1] if ordered else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Run a world without graphics.')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS),
+                        default=DEFAULT_SCENARIO)
+    parser.add_argument('--agents', type=int, default=DEFAULT_AGENTS,
+                        help='number of agents to create')
+    parser.add_argument('--ticks', type=int, default=1000,
+                        help='number of updates to run')
+    parser.add_argument('--delta', type=float, default=1/60.,
+                        help='fixed time step of each update (seconds)')
+    parser.add_argument('--size', type=int, default=500,
+                        help='world width and height')
+    parser.add_argument('--seed', type=int, help='random seed')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='save per-phase timings to a JSON file')
+    parser.add_argument('--json', action='store_true',
+                        help='print the result (with tick latency '
+                             'percentiles and peak memory) as JSON')
+    args = parser.parse_args(argv)
+
+    world = build(args.scenario, args.agents, args.size, args.seed)
+    if args.profile:
+        profiler.reset(args.ticks)
+        profiler.enabled = True
+    tick_times = []
+    elapsed = run(world, args.ticks, args.delta, tick_times)
+    if args.json:
+        print(json.dumps(report(args.scenario, world, args.ticks, elapsed,
+                                tick_times)))
+    else:
+        rate = args.ticks / elapsed if elapsed > 0 else float('inf')
+        print('%s: %d ticks, %d agents, %.3f s, %.1f ticks/sec' % (
+            args.scenario, args.ticks, len(world.agents), elapsed, rate))
+    if args.profile:
+        profiler.dump(args.profile)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,12 @@ By Clinton Woodward cwoodward@swin.edu.au
 
 '''
 from graphics import egi, KEY
-from pyglet import window, clock
+from pyglet import window, clock, app
 from pyglet.gl import *
 
 from vector2d import Vector2D
+from profiler import profiler
+from loop import FixedStepLoop
 from world import World
 from agent import Agent, AGENT_MODES  # Agent with seek, arrive, flee and pursuit
 
@@ -16,6 +18,7 @@ from agent import Agent, AGENT_MODES  # Agent with seek, arrive, flee and pursui
 def on_key_press(symbol, modifiers):
     if symbol == KEY.P:
         world.paused = not world.paused
+        sim.schedule(clock)
     elif symbol in AGENT_MODES:
         for agent in world.agents:
             agent.mode = AGENT_MODES[symbol]
@@ -24,6 +27,17 @@ def on_key_press(symbol, modifiers):
     elif symbol == KEY.I:
         for agent in world.agents:
             agent.show_info = not agent.show_info
+    # Toggle the frame timing profiler and overlay
+    elif symbol == KEY.T:
+        profiler.toggle()
+    # Toggle fixed step simulation, and interpolated rendering
+    elif symbol == KEY.F:
+        sim.toggle_fixed()
+    elif symbol == KEY.L:
+        sim.toggle_interpolate()
+    # Time warp: off, x10, x100, as fast as possible
+    elif symbol == KEY.W:
+        sim.cycle_warp()
 
 
 
@@ -32,6 +46,16 @@ def on_resize(cx, cy):
     world.cy = cy
 
 
+def on_draw():
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    sim.render()
+    # show nice FPS bottom right (default)
+    fps_display.draw()
+    if profiler.enabled:
+        profiler.render()
+    profiler.end_frame()
+
+
 if __name__ == '__main__':
 
     # create a pyglet window and set glOptions
@@ -46,6 +70,7 @@ if __name__ == '__main__':
     win.push_handlers(on_key_press)
     #win.push_handlers(on_mouse_press)
     win.push_handlers(on_resize)
+    win.push_handlers(on_draw)
 
     # create a world for agents
     world = World(500, 500)
@@ -53,15 +78,10 @@ if __name__ == '__main__':
     world.agents.append(Agent(world, 30.0, 1.0, 'target', 'ORANGE', 100.0))
     # unpause the world ready for movement
     world.paused = False
+    # update the world in fixed steps, whatever the render rate
+    sim = FixedStepLoop(world)
 
-    while not win.has_exit:
-        win.dispatch_events()
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        # show nice FPS bottom right (default)
-        delta = clock.tick()
-        world.update(delta)
-        world.render()
-        fps_display.draw()
-        # swap the double buffer
-        win.flip()
-
+    # tick the world from the clock, and draw when needed. Between frames,
+    # and while paused until an event arrives, the app sleeps.
+    sim.schedule(clock)
+    app.run()
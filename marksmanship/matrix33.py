@@ -8,6 +8,15 @@ Updated by Steve Dower
 from math import cos, sin
 
 
+def _pose(pos, fwd, side, scale):
+    ''' matrix values of scale (if not None), rotate, then translate '''
+    if scale is None:
+        return [fwd.x, fwd.y, 0., side.x, side.y, 0., pos.x, pos.y, 1.]
+    sx = scale.x
+    sy = scale.y
+    return [sx*fwd.x, sx*fwd.y, 0., sy*side.x, sy*side.y, 0., pos.x, pos.y, 1.]
+
+
 class Matrix33(object):
     '''3x3 matrix for two-dimensional operations.'''
 
@@ -20,6 +29,18 @@ class Matrix33(object):
     def reset(self):
         self._m = [1., 0., 0., 0., 1., 0., 0., 0., 1.]
 
+    @classmethod
+    def from_pose(cls, pos, fwd, side, scale=None):
+        ''' Return the matrix that scales (optional), rotates by forward and
+            side vectors and translates to pos. The same result as the
+            scale_update, rotate_by_vectors_update and translate_update
+            steps, but built directly. '''
+        return cls(_pose(pos, fwd, side, scale))
+
+    def set_pose(self, pos, fwd, side, scale=None):
+        ''' Update self to the from_pose() matrix of the given values. '''
+        self._m = _pose(pos, fwd, side, scale)
+
     def translate(self, x, y):
         '''Returns this matrix translated by x, y.'''
         return self * Matrix33([1., 0., 0., 0., 1., 0., x, y, 1.])
@@ -0,0 +1,190 @@
+'''Fixed step simulation loop
+
+Decouples the simulation rate from the render rate. Each rendered frame adds
+its (variable) frame time to an accumulator, and the world is updated in
+fixed steps of step seconds until less than one step is left. The number of
+steps per frame is capped, so a slow frame cannot make the simulation fall
+further and further behind (the extra time is dropped instead).
+
+Optionally, agent poses are interpolated between the last two steps when
+rendering, using the time left in the accumulator, so that motion stays
+smooth when the render rate is not a multiple of the simulation rate.
+
+With fixed off, each frame is a single world update with the frame time, as
+the demos have always done.
+
+The demos drive the loop from the pyglet clock (see schedule) instead of a
+busy loop, so the process sleeps between frames, and does not tick at all
+while the world is paused - it then only wakes up for window events.
+
+Time warp (see set_warp) fast-forwards the simulation: each tick runs warp
+times as many fixed steps as real time would (or as many as fit in
+warp_budget seconds), and ticks only warp_interval apart, so just a few
+progress frames a second are drawn.
+
+'''
+
+from time import perf_counter
+
+from graphics import egi
+
+WARP_MAX = float('inf')  # warp as fast as possible
+WARP_SPEEDS = (0, 10, 100, WARP_MAX)  # cycled by cycle_warp()
+
+
+class FixedStepLoop(object):
+
+    def __init__(self, world, step=1/60., max_substeps=5, fixed=True,
+                 interpolate=False):
+        self.world = world
+        self.step = step
+        self.max_substeps = max_substeps
+        self.fixed = fixed
+        self.interpolate = interpolate
+        self.accumulator = 0.0
+        self.alpha = 1.0  # fraction of a step from the previous poses
+        self.previous = []  # (agent, x, y, heading x, heading y)
+        self.dropped = 0.0  # total seconds skipped by the substep cap
+        self.sim_time = 0.0  # total seconds simulated
+        # time warp
+        self.warp = 0  # speed multiplier, 0 for off
+        self.warp_until = None  # sim_time to stop warping at
+        self.warp_budget = 0.2  # wall seconds of updates per warp tick
+        self.warp_interval = 0.25  # seconds between warp ticks (frames)
+        # clock and tick rate, once scheduled
+        self.clock = None
+        self.rate = 60.0
+
+    def advance(self, delta):
+        ''' Move the simulation on by the frame time delta. Returns the
+            number of world updates done. '''
+        if self.warp:
+            return self.advance_warp(delta)
+        if not self.fixed:
+            self.world.update(delta)
+            self.sim_time += delta
+            self.alpha = 1.0
+            return 1
+        self.accumulator += delta
+        step = self.step
+        steps = 0
+        while self.accumulator >= step:
+            if steps == self.max_substeps:
+                # too far behind, drop the rest instead of catching up
+                self.dropped += self.accumulator
+                self.accumulator = 0.0
+                break
+            if self.interpolate:
+                self.save_poses()
+            self.world.update(step)
+            self.sim_time += step
+            self.accumulator -= step
+            steps += 1
+        self.alpha = self.accumulator / step
+        return steps
+
+    def advance_warp(self, delta):
+        ''' Time warp version of advance(): run fixed steps for warp * delta
+            seconds of simulation, stopping early when warp_budget (wall
+            clock) seconds have been used. Returns the number of updates. '''
+        step = self.step
+        limit = self.warp * delta
+        deadline = perf_counter() + self.warp_budget
+        steps = 0
+        while steps * step < limit and perf_counter() < deadline:
+            if self.warp_until is not None and self.sim_time >= self.warp_until:
+                self.set_warp(0)
+                break
+            self.world.update(step)
+            self.sim_time += step
+            steps += 1
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.previous = []
+        return steps
+
+    def tick(self, delta):
+        ''' Clock callback, see schedule(). '''
+        self.advance(delta)
+
+    def schedule(self, clock, rate=60.0):
+        ''' Tick from the given (pyglet) clock rate times a second while the
+            world is running, and not at all while it is paused. Call again
+            whenever the world is paused or unpaused. '''
+        self.clock = clock
+        self.rate = rate
+        clock.unschedule(self.tick)
+        if not self.world.paused:
+            interval = self.warp_interval if self.warp else 1.0 / rate
+            clock.schedule_interval(self.tick, interval)
+
+    def set_warp(self, warp, until=None):
+        ''' Fast-forward at warp times real time (WARP_MAX for as fast as
+            possible, 0 to stop). If until is given, warping stops once
+            sim_time reaches it, e.g. set_warp(WARP_MAX, 600) to get to
+            minute 10. '''
+        self.warp = warp
+        self.warp_until = until if warp else None
+        if self.clock is not None:
+            self.schedule(self.clock, self.rate)
+
+    def cycle_warp(self):
+        ''' Change to the next of the WARP_SPEEDS. '''
+        speeds = WARP_SPEEDS
+        index = speeds.index(self.warp) if self.warp in speeds else 0
+        self.set_warp(speeds[(index + 1) % len(speeds)])
+
+    def save_poses(self):
+        ''' Remember the current agent poses, to interpolate from. '''
+        self.previous = [(agent, agent.pos.x, agent.pos.y,
+                          agent.heading.x, agent.heading.y)
+                         for agent in self.world.agents]
+
+    def toggle_fixed(self):
+        self.fixed = not self.fixed
+        self.accumulator = 0.0
+
+    def toggle_interpolate(self):
+        self.interpolate = not self.interpolate
+        self.previous = []
+
+    def render(self):
+        ''' Render the world, with agent poses interpolated between the last
+            two steps if interpolate is on. '''
+        world = self.world
+        if self.warp:
+            world.render()
+            speed = 'max' if self.warp == WARP_MAX else 'x%g' % self.warp
+            egi.white_pen()
+            egi.text_at_pos(0, 15, 'time warp %s: %.1f s' % (speed,
+                                                            self.sim_time))
+            return
+        if not (self.fixed and self.interpolate and self.previous):
+            world.render()
+            return
+        # move agents to the in-between poses, render, then put them back
+        t = self.alpha
+        half_x = world.cx / 2
+        half_y = world.cy / 2
+        current = []
+        for agent, x, y, hx, hy in self.previous:
+            pos = agent.pos
+            heading = agent.heading
+            current.append((pos.x, pos.y, heading.x, heading.y))
+            # no interpolation across a wrap around the world edge
+            if abs(pos.x - x) < half_x and abs(pos.y - y) < half_y:
+                pos.x = x + (pos.x - x) * t
+                pos.y = y + (pos.y - y) * t
+            heading.x = hx + (heading.x - hx) * t
+            heading.y = hy + (heading.y - hy) * t
+            heading.normalise()
+            heading.perp_into(agent.side)
+            agent.shape_dirty = True
+        world.render()
+        for (agent, _, _, _, _), (x, y, hx, hy) in zip(self.previous, current):
+            agent.pos.x = x
+            agent.pos.y = y
+            agent.heading.x = hx
+            agent.heading.y = hy
+            agent.heading.perp_into(agent.side)
+            agent.shape_dirty = True
@@ -5,10 +5,12 @@ By Clinton Woodward cwoodward@swin.edu.au
 
 '''
 from graphics import egi, KEY
-from pyglet import window, clock
+from pyglet import window, clock, app
 from pyglet.gl import *
 
 from vector2d import Vector2D
+from profiler import profiler
+from loop import FixedStepLoop
 from world import World
 from agent import Agent
 from random import randrange
@@ -22,6 +24,7 @@ def on_mouse_press(x, y, button, modifiers):
 def on_key_press(symbol, modifiers):
     if symbol == KEY.P:
         world.paused = not world.paused
+        sim.schedule(clock)
     elif symbol == KEY.N:
         enemy = Agent(world, Vector2D(randrange(world.cx), randrange(world.cy)), 30.0, 1.0, 'zombie', 'RED', 1.0)
         world.agents.append(enemy)
@@ -31,12 +34,34 @@ def on_key_press(symbol, modifiers):
     elif symbol == KEY.I:
         for agent in world.agents:
             agent.show_info = not agent.show_info
+    # Toggle the frame timing profiler and overlay
+    elif symbol == KEY.T:
+        profiler.toggle()
+    # Toggle fixed step simulation, and interpolated rendering
+    elif symbol == KEY.F:
+        sim.toggle_fixed()
+    elif symbol == KEY.L:
+        sim.toggle_interpolate()
+    # Time warp: off, x10, x100, as fast as possible
+    elif symbol == KEY.W:
+        sim.cycle_warp()
 
 
 
 def on_resize(cx, cy):
     world.cx = cx
     world.cy = cy
+    world.static_changed()
+
+
+def on_draw():
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    sim.render()
+    # show nice FPS bottom right (default)
+    fps_display.draw()
+    if profiler.enabled:
+        profiler.render()
+    profiler.end_frame()
 
 
 if __name__ == '__main__':
@@ -53,6 +78,7 @@ if __name__ == '__main__':
     win.push_handlers(on_key_press)
     win.push_handlers(on_mouse_press)
     win.push_handlers(on_resize)
+    win.push_handlers(on_draw)
 
     # create a world for agents
     world = World(500, 500)
@@ -62,15 +88,10 @@ if __name__ == '__main__':
     world.soldier = main
     # unpause the world ready for movement
     world.paused = False
+    # update the world in fixed steps, whatever the render rate
+    sim = FixedStepLoop(world)
 
-    while not win.has_exit:
-        win.dispatch_events()
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        # show nice FPS bottom right (default)
-        delta = clock.tick()
-        world.update(delta)
-        world.render()
-        fps_display.draw()
-        # swap the double buffer
-        win.flip()
-
+    # tick the world from the clock, and draw when needed. Between frames,
+    # and while paused until an event arrives, the app sleeps.
+    sim.schedule(clock)
+    app.run()
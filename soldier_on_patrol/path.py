@@ -107,13 +107,19 @@ class Path(object):
     def render(self):
         ''' Draw the path, open or closed, using the current pen colour. '''
         # draw base line
-        egi.blue_pen()
-        if self.looped:
-            egi.closed_shape(self._pts)
-        else:
-            egi.polyline(self._pts)
+        self.render_line()
         # draw current waypoint
         egi.orange_pen()
         wp = self.current_pt()
         egi.circle(pos=wp, radius=5, slices=32)
 
+    def render_line(self):
+        ''' Draw the path lines only. These do not change as the current way
+            point moves, so they can be a static layer of the world (see
+            World.add_static); call World.static_changed() after changing
+            the way points. '''
+        egi.blue_pen()
+        if self.looped:
+            egi.closed_shape(self._pts)
+        else:
+            egi.polyline(self._pts)